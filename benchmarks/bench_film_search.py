@@ -0,0 +1,105 @@
+"""Check and time the trigram index of the watchlist on generated lists of 10k and more titles.
+
+Search results are compared against a brute force similarity over all titles, then the times of
+building the index, searching for misspelled and partial titles and adding and removing a title
+are printed.
+
+Run from the repository root: python -m benchmarks.bench_film_search [--titles 10000 50000]
+"""
+
+import argparse
+import random
+import time
+
+from films import MIN_OVERLAP, FilmIndex, normalizeTitle, trigrams
+
+COMMON = ("the", "of", "a", "night", "day", "last", "first", "love", "war", "star", "dark", "city", "blue",
+         "river", "king", "queen", "ghost", "iron", "summer", "winter", "lost", "secret", "house", "road",
+         "heart", "fire", "ice", "dream", "shadow", "sun", "moon", "empire", "return", "rise", "fall",
+         "amélie", "café", "señor", "über", "jäger", "mädchen", "l'amour", "doctor", "mr.", "& co")
+SYLLABLES = ("ka", "lo", "mi", "ren", "tor", "vas", "el", "un", "dra", "phi", "sto", "ber", "gan", "ix", "qua", "zel", "mor", "ath")
+# distinct words besides the common ones, real titles share few trigrams
+RARE_WORDS = 5000
+QUERIES = 500
+CHECKED = 100
+
+
+def generateTitles(rng: random.Random, count: int) -> list:
+    rare = ["".join(rng.choices(SYLLABLES, k=rng.randrange(2, 5))) for _ in range(RARE_WORDS)]
+    titles = set()
+    while len(titles) < count:
+        words = [rng.choice(COMMON if rng.random() < 0.4 else rare) for _ in range(rng.randrange(1, 6))]
+        title = " ".join(words).title()
+        if rng.random() < 0.2:
+            title += f" {rng.randrange(2, 5)}"
+        titles.add(title)
+    return sorted(titles, key=lambda title: rng.random())
+
+
+def misspell(rng: random.Random, title: str) -> str:
+    """Drop, double or swap a letter, or lower the case."""
+    i = rng.randrange(len(title))
+    edit = rng.randrange(4)
+    if edit == 0:
+        return title[:i] + title[i + 1:]
+    if edit == 1:
+        return title[:i] + title[i] + title[i:]
+    if edit == 2 and i + 1 < len(title):
+        return title[:i] + title[i + 1] + title[i] + title[i + 2:]
+    return title.lower()
+
+
+def bruteForce(titles: list, query: str, limit: int) -> list:
+    grams = trigrams(normalizeTitle(query))
+    needed = max(1, round(len(grams) * MIN_OVERLAP))
+    results = []
+    for title in titles:
+        title_grams = trigrams(normalizeTitle(title))
+        shared = len(grams & title_grams)
+        if shared >= needed:
+            results.append((2 * shared / (len(grams) + len(title_grams)), title))
+    results.sort(key=lambda result: (-result[0], result[1]))
+    return results[:limit]
+
+
+def timed(callback, repeat: int) -> float:
+    """Return the mean microseconds of a call."""
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        callback(i)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def run(count: int) -> None:
+    rng = random.Random(count)
+    titles = generateTitles(rng, count)
+
+    t0 = time.perf_counter()
+    index = FilmIndex(titles)
+    build = time.perf_counter() - t0
+
+    originals = [rng.choice(titles) for _ in range(QUERIES)]
+    misspelled = [misspell(rng, title) for title in originals]
+    partial = [" ".join(rng.choice(titles).split()[:2]) for _ in range(QUERIES)]
+    for query in misspelled[:CHECKED] + partial[:CHECKED]:
+        assert index.search(query, 10) == bruteForce(titles, query, 10), query
+    found = sum([title for _, title in index.search(query, 1)] == [original] for query, original in zip(misspelled, originals))
+
+    print(f"{count} titles, index built in {build * 1000:.0f} ms, search matches brute force on {2 * CHECKED} queries")
+    print(f"  exact lookup          {timed(lambda i: index.get(titles[i]), QUERIES):8.1f} us")
+    print(f"  misspelled title      {timed(lambda i: index.search(misspelled[i]), QUERIES):8.1f} us  ({found} of {QUERIES} best match)")
+    print(f"  without the index     {timed(lambda i: bruteForce(titles, misspelled[i], 5), 20):8.1f} us")
+    print(f"  first words of title  {timed(lambda i: index.search(partial[i]), QUERIES):8.1f} us")
+    print(f"  add and remove        {timed(lambda i: index.remove(index.add(f'Bench Film {i}') and f'Bench Film {i}'), QUERIES):8.1f} us"
+          f"  (rebuilding takes {build * 1e6:.0f} us)")
+
+
+def main(args) -> None:
+    for count in args.titles:
+        run(count)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--titles", type=int, nargs="+", default=[10000, 50000], help="watchlist sizes")
+    main(parser.parse_args())
@@ -0,0 +1,203 @@
+"""Replay update streams through the bot's command handlers and job callbacks against a local fake Bot API.
+
+Reports p50/p99 latency of single updates and the throughput of a burst per command, e.g. to
+catch regressions in the member filters or nextTrashCommand in CI.
+
+Run from the repository root: python -m benchmarks.bench_handlers [--latency 0.02] [--flood-every 50] [--json results.json]
+"""
+
+import argparse
+import asyncio
+from datetime import date, timedelta
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import yaml
+
+import sendqueue
+from benchmarks.fake_bot_api import FakeBotApi
+
+GROUP = -100
+MEMBERS = list(range(1000, 1200))
+BIRTHDAYS = 300
+FILMS = 2000
+
+
+def writeFiles(directory: str, api: FakeBotApi) -> None:
+    """Write a config with many birthdays, a daily recurring calendar, a long watchlist and a camera stand-in."""
+    rng = random.Random(1)
+    birthdays = {f"Person{i}": f"{rng.randrange(1, 29):02}/{rng.randrange(1, 13):02}/{rng.randrange(1950, 2010)}" for i in range(BIRTHDAYS)}
+    birthdays["Today"] = date.today().strftime("%d/%m/1990")
+
+    picture = os.path.join(directory, "frame.jpg")
+    with open(picture, "wb") as f:
+        f.write(b"\xff\xd8\xff\xe0" + bytes(20000) + b"\xff\xd9")
+
+    config = {
+        "api_base_url": api.base_url,
+        "birthday_msg_time": "00:00:00",
+        "birthdays": birthdays,
+        "camera_command": ["cp", picture, "{output}"],
+        "group_chat_id": GROUP,
+        "ics_trash_cans": {"BIO": "Bio", "RM1": "Restmüll"},
+        "maintainer_chat_id": MEMBERS[0],
+        "member_ids": MEMBERS,
+        "picture_path": os.path.join(directory, "pictures"),
+        "selected_trash_cans": ["BIO", "RM1"],
+        "snooze_time": "02:00:00",
+        "token": "123:bench",
+        "trash_msg_time": "17:00:00",
+    }
+    with open(os.path.join(directory, "config.yaml"), "w") as f:
+        yaml.dump(config, f)
+    with open(os.path.join(directory, "waste_calendar.ics"), "w", newline="") as f:
+        f.write("\r\n".join([
+            "BEGIN:VCALENDAR", "VERSION:2.0",
+            "BEGIN:VEVENT", "DTSTART;VALUE=DATE:20240101", "RRULE:FREQ=DAILY", "DESCRIPTION:BIO", "END:VEVENT",
+            "BEGIN:VEVENT", "DTSTART;VALUE=DATE:20240103", "RRULE:FREQ=WEEKLY;INTERVAL=2", "DESCRIPTION:RM1", "END:VEVENT",
+            "END:VCALENDAR", ""]))
+    with open(os.path.join(directory, "watchlist.yaml"), "w") as f:
+        yaml.dump({"films": [f"Film number {i}" for i in range(FILMS)]}, f)
+
+
+def quantiles(latencies: list) -> tuple:
+    if len(latencies) < 2:
+        return latencies[0], latencies[0]
+    cuts = statistics.quantiles(latencies, n=100)
+    return cuts[49], cuts[98]
+
+
+class Harness:
+    """Sends updates through the fake Bot API and waits for the bot's answers."""
+
+    def __init__(self, api: FakeBotApi, bot, rounds: int, burst: int) -> None:
+        self.api = api
+        self.bot = bot
+        self.rounds = rounds
+        self.burst = burst
+        self.results = {}
+
+    async def deliver(self, updates: list, messages: int) -> float:
+        """Push the updates and return the seconds until the expected number of messages was sent."""
+        expected = len(self.api.sent) + messages
+        t0 = time.monotonic()
+        for update in updates:
+            self.api.pushUpdate(update)
+        await self.api.waitForSent(expected, timeout=60)
+        return time.monotonic() - t0
+
+    async def command(self, name: str, makeUpdate, messages: int = 1, prepare=None, burst: bool = True) -> None:
+        """Measure single updates one after another, then a burst of updates from different members."""
+        latencies = []
+        for i in range(self.rounds):
+            if prepare:
+                prepare()
+            latencies.append(await self.deliver([makeUpdate(i)], messages))
+
+        throughput = None
+        if burst:
+            updates = [makeUpdate(self.rounds + i) for i in range(self.burst)]
+            throughput = self.burst / await self.deliver(updates, messages * self.burst)
+        self.report(name, latencies, throughput)
+
+    async def job(self, name: str, callback, household, day) -> None:
+        """Measure a job callback run right away for the day it was planned for."""
+        job_queue = self.bot.application.job_queue
+        latencies = []
+        for _ in range(self.rounds):
+            expected = len(self.api.sent) + 1
+            t0 = time.monotonic()
+            job_queue.run_once(callback, when=0, chat_id=GROUP, data=(household.name, day))
+            await self.api.waitForSent(expected, timeout=60)
+            latencies.append(time.monotonic() - t0)
+        self.report(name, latencies, None)
+
+    def report(self, name: str, latencies: list, throughput: float) -> None:
+        p50, p99 = quantiles(latencies)
+        self.results[name] = {"p50_ms": p50 * 1000, "p99_ms": p99 * 1000, "updates_per_s": throughput}
+        rate = f"{throughput:8.0f} updates/s" if throughput else ""
+        print(f"{name:<16} p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms  {rate}")
+
+
+def member(i: int) -> int:
+    return MEMBERS[i % len(MEMBERS)]
+
+
+async def run(api: FakeBotApi, rounds: int, burst: int) -> dict:
+    from bot import ButlerBot
+    bot = ButlerBot()
+    application = bot.application
+    await application.initialize()
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    await application.start()
+
+    harness = Harness(api, bot, rounds, burst)
+    household = bot.registry.forChat(GROUP)
+    private = lambda text: lambda i: api.makeUpdate(text, member(i), member(i))
+
+    for name in ("hello", "id", "next_trash", "next_birthday", "cake", "random_film", "birthdays", "list_films"):
+        await harness.command("/" + name, private("/" + name))
+    await harness.command("/add_film", lambda i: api.makeUpdate(f"/add_film Bench film {i}", member(i), member(i)))
+    await harness.command("/find_film", lambda i: api.makeUpdate(f"/find_film Film numbr {i}", member(i), member(i)))
+    await harness.command("/remove_film", lambda i: api.makeUpdate(f"/remove_film bench FILM {i}", member(i), member(i)))
+    await harness.command("/talk", private("/talk hello everyone"))
+    # capturing, then the photo
+    await harness.command("/picture", private("/picture"), messages=2)
+
+    def waiting():
+        household.state["waiting_for_disable"] = True
+    # only the first /done of a burst is answered
+    await harness.command("/done", lambda i: api.makeUpdate("/done", GROUP, member(i)), prepare=waiting, burst=False)
+
+    # turn the pages of the newest paged list, retried sends may arrive out of order
+    keys = [params["reply_markup"]["inline_keyboard"][0][-1]["callback_data"].split(":")[1]
+            for _, method, params in api.sent if params.get("reply_markup")]
+    key = max(keys, key=lambda key: int(key, 16))
+    message_id = len(api.sent)
+    await harness.command("page", lambda i: api.makeCallbackQuery(f"page:{key}:{i % 2}", member(i), member(i), message_id))
+
+    tomorrow = household.today() + timedelta(days=1)
+    await harness.job("trashCheck", bot.trashCheck, household, tomorrow)
+    await harness.job("reminder", bot.reminder, household, tomorrow)
+    await harness.job("birthdayCheck", bot.birthdayCheck, household, household.today())
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return harness.results
+
+
+async def main(args) -> None:
+    # Lift the flood limits of the send queue, this measures the handlers
+    sendqueue.GLOBAL_RATE = sendqueue.PRIVATE_RATE = sendqueue.GROUP_RATE = sendqueue.GROUP_BURST = 1e6
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        api = FakeBotApi(latency=args.latency, flood_every=args.flood_every)
+        await api.start()
+        writeFiles(tmp, api)
+        os.chdir(tmp)
+        try:
+            results = await run(api, args.rounds, args.burst)
+        finally:
+            os.chdir(cwd)
+            await api.stop()
+
+    print(f"\n{len(api.sent)} messages sent, {api.rejected} answered with 429")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=100, help="single updates per command")
+    parser.add_argument("--burst", type=int, default=200, help="updates per burst")
+    parser.add_argument("--latency", type=float, default=0, help="seconds the fake Bot API takes to answer")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every n-th message with 429")
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(main(parser.parse_args()))
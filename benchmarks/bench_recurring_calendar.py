@@ -0,0 +1,52 @@
+"""Time the lazy expansion of recurring events on a generated calendar.
+
+The expansion is compared against dateutil in tests/test_waste.py, this prints the query times of
+the lazy schedule.
+
+Run from the repository root: python -m benchmarks.bench_recurring_calendar
+"""
+
+from datetime import date, timedelta
+import os
+import random
+import tempfile
+import time
+
+from tests.test_waste import SELECTED, generateEvents, writeCalendar
+from utils import loadWasteEvents
+import waste
+
+QUERIES = 2000
+
+
+def main():
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        ics_path = os.path.join(tmp, "waste_calendar.ics")
+        cache_path = os.path.join(tmp, ".waste_calendar.ics.cache")
+        writeCalendar(ics_path, generateEvents(rng))
+        loadWasteEvents(ics_path, SELECTED, cache_path)
+
+        t0 = time.perf_counter()
+        schedule = loadWasteEvents(ics_path, SELECTED, cache_path)
+        load = time.perf_counter() - t0
+
+        today = date(2026, 10, 17)
+        t0 = time.perf_counter()
+        for _ in range(QUERIES):
+            schedule.next_after(today)
+            schedule.on(today)
+        warm = (time.perf_counter() - t0) / QUERIES
+
+        t0 = time.perf_counter()
+        for i in range(QUERIES):
+            schedule.next_after(today + timedelta(days=i * 7))
+        spread = (time.perf_counter() - t0) / QUERIES
+        print(f"load from the cache                {load * 1e6:8.1f} us")
+        print(f"next_after + on in a cached window {warm * 1e6:8.1f} us")
+        print(f"next_after over {QUERIES * 7 // 365} years         {spread * 1e6:8.1f} us"
+              f"  ({len(schedule._windows)} of at most {waste.MAX_WINDOWS} windows kept)")
+
+
+if __name__ == '__main__':
+    main()
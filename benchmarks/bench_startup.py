@@ -0,0 +1,77 @@
+"""Time the cold start of the bot process against a local fake Bot API.
+
+Starts bot.py in a fresh interpreter with a command already waiting, reports the seconds until
+it is answered and the startup profile the bot prints once its households are loaded.
+
+Run from the repository root: python -m benchmarks.bench_startup [--runs 5] [--films 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import bench_handlers
+from benchmarks.fake_bot_api import FakeBotApi
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def startOnce(films: int) -> tuple:
+    """Return the seconds until the waiting command was answered and the printed profile."""
+    # A fresh fake Bot API per run, the long poll of the previous bot may still be pending
+    api = FakeBotApi()
+    await api.start()
+    member = bench_handlers.MEMBERS[1]
+    api.pushUpdate(api.makeUpdate("/next_trash", member, member))
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_handlers.FILMS = films
+        bench_handlers.writeFiles(tmp, api)
+        try:
+            return await launch(api, tmp)
+        finally:
+            await api.stop()
+
+
+async def launch(api: FakeBotApi, directory: str) -> tuple:
+    t0 = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", "import bot; bot.main()", cwd=directory, stdout=asyncio.subprocess.PIPE,
+        env={**os.environ, "PYTHONPATH": REPO, "PYTHONUNBUFFERED": "1"})
+    try:
+        await api.waitForSent(1, timeout=60)
+        answered = time.monotonic() - t0
+
+        profile = []
+        while not profile or not profile[-1].startswith("total"):
+            line = (await asyncio.wait_for(process.stdout.readline(), 60)).decode()
+            if not line:
+                raise RuntimeError("the bot exited before printing its startup profile")
+            if profile or line.startswith("Startup profile"):
+                profile.append(line.rstrip())
+    finally:
+        process.send_signal(signal.SIGINT)
+        await process.wait()
+    return answered, profile
+
+
+async def main(args) -> None:
+    answers = []
+    for _ in range(args.runs):
+        answered, profile = await startOnce(args.films)
+        answers.append(answered)
+
+    print(f"command waiting at launch answered after {statistics.median(answers) * 1000:.0f} ms "
+          f"(median of {args.runs}, {args.films} films)")
+    print("\n".join(profile))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts")
+    parser.add_argument("--films", type=int, default=bench_handlers.FILMS, help="titles on the watchlist")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""Compare load times of the waste calendar on a synthetic 10-year calendar.
+
+Run from the repository root: python -m benchmarks.bench_waste_calendar
+"""
+
+from datetime import date, timedelta
+import os
+import tempfile
+import time
+
+import icalendar
+
+from utils import loadWasteEvents
+from waste import WasteSchedule, streamWasteEvents
+
+CANS = ["BIO", "PPK", "RM1", "WET", "GLS", "SPM"]
+SELECTED = ["BIO", "RM1"]
+YEARS = 10
+REPEATS = 5
+
+
+def writeCalendar(path: str) -> int:
+    """Write a calendar with a weekly collection per can and return the number of events."""
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//TelegramButler//bench//EN"]
+    start = date(2024, 1, 1)
+    count = 0
+    for week in range(YEARS * 52):
+        for offset, can in enumerate(CANS):
+            day = start + timedelta(weeks=week, days=offset % 5)
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{week}-{can}@bench",
+                f"DTSTAMP:20240101T000000Z",
+                f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+                f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}",
+                f"SUMMARY:{can} Abfuhr",
+                f"DESCRIPTION:{can} Tonne bitte bis 6 Uhr an den Straßenrand stellen\\, danke. Weitere Infos unter",
+                " https://example.org/abfuhrkalender",
+                "BEGIN:VALARM",
+                "ACTION:DISPLAY",
+                "DESCRIPTION:Reminder",
+                "TRIGGER:-PT12H",
+                "END:VALARM",
+                "END:VEVENT",
+            ]
+            count += 1
+    lines.append("END:VCALENDAR")
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("\r\n".join(lines) + "\r\n")
+    return count
+
+
+def loadWithIcalendar(path: str) -> WasteSchedule:
+    """Previous loader: build the full icalendar object tree and walk every component."""
+    with open(path, 'rb') as e:
+        ecal = icalendar.Calendar.from_ical(e.read())
+    events = []
+    for component in ecal.walk():
+        if not component.name == 'VEVENT':
+            continue
+        description = component.get('description')[:3]
+        if description not in SELECTED:
+            continue
+        events.append((component.get('dtstart').dt, description))
+    return WasteSchedule(events)
+
+
+def loadStreaming(path: str) -> WasteSchedule:
+    with open(path, 'rb') as e:
+        return WasteSchedule(*streamWasteEvents(e, SELECTED))
+
+
+def bench(name: str, func, prepare=None) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        if prepare:
+            prepare()
+        t0 = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - t0)
+    best = min(timings)
+    print(f"{name:<10} {best * 1000:9.1f} ms  ({len(result)} collection days)")
+    return best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        ics_path = os.path.join(tmp, "waste_calendar.ics")
+        cache_path = os.path.join(tmp, ".waste_calendar.ics.cache")
+        count = writeCalendar(ics_path)
+        print(f"{count} VEVENTs, {os.path.getsize(ics_path) / 1e6:.1f} MB\n")
+
+        def dropCache():
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+
+        cold = bench("cold", lambda: loadWithIcalendar(ics_path))
+        streaming = bench("streaming", lambda: loadWasteEvents(ics_path, SELECTED, cache_path), prepare=dropCache)
+        warm = bench("warm", lambda: loadWasteEvents(ics_path, SELECTED, cache_path))
+
+        assert loadWithIcalendar(ics_path).range(date.min, date.max) == loadStreaming(ics_path).range(date.min, date.max)
+        print(f"\nstreaming is {cold / streaming:.1f}x, warm cache {cold / warm:.1f}x faster than cold")
+
+
+if __name__ == '__main__':
+    main()
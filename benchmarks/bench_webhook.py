@@ -0,0 +1,136 @@
+"""Compare handler latency and throughput of webhook and polling mode against a local fake Bot API.
+
+Run from the repository root: python -m benchmarks.bench_webhook
+Needs python-telegram-bot[webhooks].
+"""
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+import yaml
+
+import sendqueue
+from benchmarks.fake_bot_api import FakeBotApi
+
+USERS = 200
+LATENCY_ROUNDS = 100
+BURST = 300
+SECRET = "bench-secret"
+
+
+def writeFiles(directory: str, api: FakeBotApi) -> None:
+    """Write a config, an empty calendar and an empty watchlist for the benchmark."""
+    config = {
+        "api_base_url": api.base_url,
+        "birthday_msg_time": "00:00:00",
+        "birthdays": {"Anna": "02/02/1985"},
+        "group_chat_id": -100,
+        "ics_trash_cans": {"BIO": "Bio"},
+        "maintainer_chat_id": 1000,
+        "member_ids": list(range(1000, 1000 + USERS)),
+        "selected_trash_cans": ["BIO"],
+        "snooze_time": "02:00:00",
+        "token": "123:bench",
+        "trash_msg_time": "17:00:00",
+    }
+    with open(os.path.join(directory, "config.yaml"), "w") as f:
+        yaml.dump(config, f)
+    with open(os.path.join(directory, "waste_calendar.ics"), "w") as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nEND:VCALENDAR\r\n")
+    with open(os.path.join(directory, "watchlist.yaml"), "w") as f:
+        yaml.dump({"films": []}, f)
+
+
+async def measure(api: FakeBotApi, deliver) -> tuple:
+    """Return the round trip latencies of single updates and the throughput of a burst."""
+    latencies = []
+    for i in range(LATENCY_ROUNDS):
+        user_id = 1000 + i % USERS
+        expected = len(api.sent) + 1
+        t0 = time.monotonic()
+        await deliver([api.makeUpdate("/hello", user_id, user_id)])
+        await api.waitForSent(expected)
+        latencies.append(api.sent[expected - 1][0] - t0)
+
+    expected = len(api.sent) + BURST
+    updates = [api.makeUpdate("/hello", 1000 + i % USERS, 1000 + i % USERS) for i in range(BURST)]
+    t0 = time.monotonic()
+    await deliver(updates)
+    await api.waitForSent(expected, timeout=120)
+    throughput = BURST / (time.monotonic() - t0)
+    return latencies, throughput
+
+
+def report(mode: str, latencies: list, throughput: float) -> None:
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{mode:<8} p50 {quantiles[49] * 1000:7.2f} ms  p99 {quantiles[98] * 1000:7.2f} ms  {throughput:8.0f} updates/s")
+
+
+async def runPolling(api: FakeBotApi) -> None:
+    from bot import ButlerBot
+    application = ButlerBot().application
+    await application.initialize()
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    await application.start()
+
+    async def deliver(updates):
+        for update in updates:
+            api.pushUpdate(update)
+
+    report("polling", *await measure(api, deliver))
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+
+async def runWebhook(api: FakeBotApi) -> None:
+    from bot import ButlerBot
+    application = ButlerBot().application
+    await application.initialize()
+    port = 18443
+    url = f"http://127.0.0.1:{port}/telegram"
+    await application.updater.start_webhook(listen="127.0.0.1", port=port, url_path="telegram",
+                                            webhook_url=url, secret_token=SECRET)
+    await application.start()
+    assert api.webhook_url == url
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=50), timeout=60) as client:
+        rejected = await client.post(url, json=api.makeUpdate("/hello", 1000, 1000),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        assert rejected.status_code == 403, rejected.status_code
+
+        async def deliver(updates):
+            await asyncio.gather(*(client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                                   for update in updates))
+
+        report("webhook", *await measure(api, deliver))
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+
+async def main():
+    # Lift the flood limits, this measures the transport and the handlers
+    sendqueue.GLOBAL_RATE = sendqueue.PRIVATE_RATE = 1e6
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        api = FakeBotApi()
+        await api.start()
+        writeFiles(tmp, api)
+        os.chdir(tmp)
+        try:
+            await runPolling(api)
+            await runWebhook(api)
+        finally:
+            os.chdir(cwd)
+            await api.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
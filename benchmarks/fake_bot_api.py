@@ -0,0 +1,214 @@
+"""Minimal local stand-in for the Telegram Bot API, for offline benchmarks.
+
+Point the bot at it with api_base_url: http://127.0.0.1:<port>/bot in the config.
+"""
+
+import asyncio
+from email.parser import BytesParser
+from email.policy import HTTP
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl
+
+# Calls that put a message into a chat, these are recorded in sent
+MESSAGE_METHODS = ('sendMessage', 'sendPhoto', 'editMessageText')
+
+
+class FakeBotApi:
+    """Answers Bot API calls over HTTP, serves queued updates via getUpdates and records sent messages and photos.
+
+    latency delays every answer except getUpdates by that many seconds. With flood_every set,
+    every flood_every-th message call is answered with 429 Too Many Requests and retry_after.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0, flood_every: int = 0, retry_after: int = 1) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.server = None
+        self.updates = asyncio.Queue()
+        self.sent = []
+        self.sent_event = asyncio.Event()
+        self.calls = {}
+        self.rejected = 0
+        self.webhook_url = None
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._message_calls = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    def makeUpdate(self, text: str, chat_id: int, user_id: int) -> dict:
+        """Return the JSON of an update with a text message sent just now."""
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group", "title": "Group"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User" + str(user_id)},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else [],
+            },
+        }
+
+    def makeCallbackQuery(self, data: str, chat_id: int, user_id: int, message_id: int) -> dict:
+        """Return the JSON of an update with a button press on a message of the bot."""
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(chat_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": "User" + str(user_id)},
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group", "title": "Group"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Butler"},
+                    "text": "",
+                },
+            },
+        }
+
+    def pushUpdate(self, update: dict) -> None:
+        """Queue an update for the next getUpdates call."""
+        self.updates.put_nowait(update)
+
+    async def waitForSent(self, count: int, timeout: float = 30) -> None:
+        """Wait until at least count messages were sent."""
+        deadline = time.monotonic() + timeout
+        while len(self.sent) < count:
+            self.sent_event.clear()
+            await asyncio.wait_for(self.sent_event.wait(), max(deadline - time.monotonic(), 0))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                method = path.rsplit("/", 1)[-1]
+                params = self._parseParams(headers.get("content-type", ""), body)
+                self.calls[method] = self.calls.get(method, 0) + 1
+                if self.latency and method != "getUpdates":
+                    await asyncio.sleep(self.latency)
+
+                if self._flooded(method):
+                    self.rejected += 1
+                    status = b"429 Too Many Requests"
+                    payload = {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after " + str(self.retry_after),
+                               "parameters": {"retry_after": self.retry_after}}
+                else:
+                    status = b"200 OK"
+                    payload = {"ok": True, "result": await self._call(method, params)}
+                payload = json.dumps(payload).encode()
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\nContent-Length: "
+                             + str(len(payload)).encode() + b"\r\n\r\n" + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _flooded(self, method: str) -> bool:
+        if method not in MESSAGE_METHODS or not self.flood_every:
+            return False
+        self._message_calls += 1
+        return self._message_calls % self.flood_every == 0
+
+    @staticmethod
+    def _parseParams(content_type: str, body: bytes) -> dict:
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("multipart/form-data"):
+            # uploads, files are kept as bytes
+            message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+            params = {}
+            for part in message.iter_parts():
+                payload = part.get_payload(decode=True)
+                if part.get_filename() is None:
+                    payload = payload.decode()
+                    try:
+                        payload = json.loads(payload)
+                    except ValueError:
+                        pass
+                params[part.get_param("name", header="content-disposition")] = payload
+            return params
+        params = {}
+        for key, value in parse_qsl(body.decode()):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def _call(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Butler", "username": "butler_bot",
+                    "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if method == "getUpdates":
+            return await self._getUpdates(float(params.get("timeout", 0)))
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method in MESSAGE_METHODS:
+            return self._record(method, params)
+        return True
+
+    async def _getUpdates(self, timeout: float) -> list:
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout) if timeout else self.updates.get_nowait())
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return []
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def _record(self, method: str, params: dict) -> dict:
+        chat_id = params.get("chat_id")
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "group"},
+        }
+        if method == "sendPhoto":
+            photo = params.get("photo")
+            # a file id sent again refers to an uploaded photo
+            file_id = photo if isinstance(photo, str) else "photo" + str(next(self._file_ids))
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+        else:
+            message["text"] = params.get("text", "")
+        self.sent.append((time.monotonic(), method, params))
+        self.sent_event.set()
+        return message
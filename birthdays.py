@@ -0,0 +1,77 @@
+"""Sorted calendar index of the birthdays."""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+import calendar
+
+from utils import toDate
+
+
+def _key(month: int, day: int) -> int:
+    return month * 32 + day
+
+
+def _occurrence(year: int, key: int) -> date:
+    """Return the date a birthday is celebrated in the given year, 29 February falls on the 28th in non-leap years."""
+    month, day = divmod(key, 32)
+    if month == 2 and day == 29 and not calendar.isleap(year):
+        day = 28
+    return date(year, month, day)
+
+
+def _lastKeyOn(day: date) -> int:
+    """Return the largest key celebrated on the given date."""
+    if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+        return _key(2, 29)
+    return _key(day.month, day.day)
+
+
+class BirthdayIndex:
+    """Birthdays parsed once and sorted by (month, day) for bisection."""
+
+    def __init__(self, birthdays: dict) -> None:
+        self.source = dict(birthdays)
+        entries = []
+        for name, date_str in self.source.items():
+            try:
+                birthday = toDate(date_str)
+            except (TypeError, ValueError):
+                print(f"Ignoring invalid birthday of {name}: {date_str}")
+                continue
+            entries.append((_key(birthday.month, birthday.day), name, birthday))
+        entries.sort(key=lambda entry: entry[0])
+
+        self._keys = array('H', (entry[0] for entry in entries))
+        self._names = [entry[1] for entry in entries]
+        self._birthdays = [entry[2] for entry in entries]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def today(self, day: date) -> list:
+        """Return (name, birthday) of everyone celebrating on the given date."""
+        lo = bisect_left(self._keys, _key(day.month, day.day))
+        hi = bisect_right(self._keys, _lastKeyOn(day), lo)
+        return [(self._names[i], self._birthdays[i]) for i in range(lo, hi)]
+
+    def next(self, day: date, n: int = 1) -> list:
+        """Return (name, birthday, celebration date) of the next n birthdays strictly after the given date."""
+        return self._upcoming(day, lambda count, when: count < n)
+
+    def within(self, day: date, days: int) -> list:
+        """Return (name, birthday, celebration date) of all birthdays in the days after the given date."""
+        return self._upcoming(day, lambda count, when: (when - day).days <= days)
+
+    def _upcoming(self, day: date, keep) -> list:
+        result = []
+        start = bisect_right(self._keys, _lastKeyOn(day))
+        for offset in range(len(self._keys)):
+            i = (start + offset) % len(self._keys)
+            when = _occurrence(day.year, self._keys[i])
+            if when <= day:
+                when = _occurrence(day.year + 1, self._keys[i])
+            if not keep(len(result), when):
+                break
+            result.append((self._names[i], self._birthdays[i], when))
+        return result
@@ -1,86 +1,220 @@
 """Main module of the bot."""
 
-from datetime import date, timedelta, time, datetime
+from time import perf_counter
+# taken before the other imports for the startup profile
+STARTED = perf_counter()
+
+import asyncio
+from datetime import timedelta, datetime
 from functools import wraps
-from telegram import *
-from telegram.ext import *
-import pytz
+from telegram import Update, constants
+from telegram.ext import Application, ApplicationBuilder, CallbackContext, CallbackQueryHandler, CommandHandler, ContextTypes, filters
 import random
-from utils import *
+import secrets
+from utils import fileSignature, getRandomAnimalEmoji, loadYAML, toGermanWeekday
 import os
-from camera import capture_and_transfer_image
+from concurrency import ChatOrderedUpdateProcessor
+from films import SIMILAR_TITLE
+from household import HouseholdRegistry, scanHouseholds
+from metrics import Metrics, serveMetrics
+from middleware import GROUP_CHAT, PRIVATE_CHAT, MemberFilter, selectBacklog
+from pages import PageStore, pageKeyboard, pageText, paginate
+from persistence import WriteBehindStore
+from reminders import BIRTHDAY, CALENDAR_END, DISABLE, REMINDER, TRASH_CHECK, WINDOW_DAYS, plannedReminders
+from sendqueue import PRIORITY_CHAT, PRIORITY_REMINDER, SendQueue
+from startup import StartupProfile
 
-CALENDAR_PATH = 'waste_calendar.ics'
 CONFIG_PATH = 'config.yaml'
-WATCHLIST_PATH = 'watchlist.yaml'
+CAMERA_CONFIG_KEYS = ('picture_path', 'camera_command', 'camera_timeout', 'picture_max_age', 'picture_max_size', 'picture_quality')
 
 
 class ButlerBot:
-    def __init__(self) -> None:              
+    def __init__(self, profile: StartupProfile = None) -> None:              
         self.application = None        
+        self.profile = profile or StartupProfile(perf_counter())
+
+        self.config = self.loadConfig()
+        self.profile.mark("config")
+        self.store = WriteBehindStore(on_saved=self.fileSaved)
+        # Only the household configs are read here, calendars and watchlists are loaded after polling started
+        self.registry = HouseholdRegistry(scanHouseholds(self.config, self.store), max_loaded=self.config.get("max_loaded_households", 32))
+        self.profile.mark("households")
+        self.metrics = Metrics()
+        self.metrics_server = None
+        # created with the first picture
+        self.camera = None
+        self.page_store = PageStore()
+        self.file_signatures = {CONFIG_PATH: fileSignature(CONFIG_PATH)}
+
+        self.send_queue = SendQueue(observe=self.metrics.observer("api"))
+        builder = ApplicationBuilder().token(self.config["token"])
+        if self.config.get("api_base_url"):
+            # e.g. a local Bot API server
+            builder = builder.base_url(self.config["api_base_url"])
+        builder = builder.rate_limiter(self.send_queue)
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(self.config.get("max_concurrent_updates", 8)))
+        self.application = builder.post_init(self.postInit).post_shutdown(self.postShutdown).build()
+        self.profile.mark("application")
+
+        # Updates of anybody else are rejected by the filters before they reach a handler
+        members = MemberFilter(self.registry)
+        self.maintainer_filter = filters.Chat(chat_id=self.config.get("maintainer_chat_id") or [])
+        self.addCommand('birthdays', self.birthdaysCommand, members)
+        self.addCommand('cake', self.cakeCommand, members)
+        self.addCommand('done', self.doneCommand, MemberFilter(self.registry, GROUP_CHAT))
+        self.addCommand('id', self.idCommand)
+        self.addCommand('next_birthday', self.nextBirthdayCommand, members)
+        self.addCommand('next_trash', self.nextTrashCommand, members)
+        self.addCommand('hello', self.helloCommand, members)
+        self.addCommand('talk', self.talkCommand, MemberFilter(self.registry, PRIVATE_CHAT))
+        self.addCommand('add_film', self.addFilmCommand, members)
+        self.addCommand('random_film', self.randomFilmCommand, members)
+        self.addCommand('list_films', self.listFilmsCommand, members)
+        self.addCommand('remove_film', self.removeFilmCommand, members)
+        self.addCommand('find_film', self.findFilmCommand, members)
+        self.addCommand('picture', self.pictureCommand, members)
+        self.addCommand('stats', self.statsCommand, self.maintainer_filter)
+        self.application.add_handler(CallbackQueryHandler(self.metrics.instrument("callback", "page", self.pageCallback), pattern=r'^page:'))
+        
+        # send start message to maintainer
+        if self.config.get("maintainer_chat_id"):
+            self.application.job_queue.run_once(self.timedJob(self.sendStartMsg), when=5, chat_id=self.config["maintainer_chat_id"])
+
+        # the plans are spread like the reminders, each loads its household only while planning
+        for household in self.registry:
+            self.scheduleReminders(household, delay=household.offset)
+
+        # keep the picture directory from filling up the SD card
+        self.application.job_queue.run_repeating(self.timedJob(self.evictPictures), interval=3600, first=60, name="evictPictures")
+
+        # watch the config, watchlist and calendar files for changes
+        self.application.job_queue.run_repeating(self.timedJob(self.reloadChangedFiles), interval=self.config.get("reload_interval", 10), name="reloadChangedFiles")
+
+        # runs once polling started
+        self.application.job_queue.run_once(self.startupReport, when=0, name="startupReport")
+        self.profile.mark("handlers")
+
+
+    def addCommand(self, command: str, callback, update_filter=None) -> None:
+        """Register a command for the updates passing the filter, its calls are recorded in the metrics."""
+        self.application.add_handler(CommandHandler(command, self.metrics.instrument("command", command, callback), filters=update_filter))
+
+
+    def timedJob(self, callback):
+        """Return the job callback wrapped to record its calls in the metrics."""
+        return self.metrics.instrument("job", callback.__name__, callback)
+
 
-        self.config = loadYAML(CONFIG_PATH)
+    def loadConfig(self) -> dict:
+        """Load the config file and apply the token overrides."""
+        config = loadYAML(CONFIG_PATH)
         # Allow overriding sensitive values via environment variables or a token file
         env_token = os.getenv("TELEGRAM_TOKEN")
         token_file = os.getenv("TELEGRAM_TOKEN_FILE")
         if token_file and os.path.exists(token_file):
             try:
                 with open(token_file, 'r') as f:
-                    self.config["token"] = f.read().strip()
+                    config["token"] = f.read().strip()
             except Exception:
                 pass
         elif env_token:
-            self.config["token"] = env_token
-        self.waste_events = loadWasteEvents(CALENDAR_PATH, self.config['selected_trash_cans'])        
-        self.watchlist = loadYAML(WATCHLIST_PATH)
-
-        self.application = ApplicationBuilder().token(self.config["token"]).build()
-
-        self.application.add_handler(CommandHandler('birthdays', self.birthdaysCommand))
-        self.application.add_handler(CommandHandler('cake', self.cakeCommand))
-        self.application.add_handler(CommandHandler('done', self.doneCommand))
-        self.application.add_handler(CommandHandler('id', self.idCommand))
-        self.application.add_handler(CommandHandler('next_birthday', self.nextBirthdayCommand))
-        self.application.add_handler(CommandHandler('next_trash', self.nextTrashCommand))
-        self.application.add_handler(CommandHandler('hello', self.helloCommand))
-        self.application.add_handler(CommandHandler('talk', self.talkCommand))
-        self.application.add_handler(CommandHandler('add_film', self.addFilmCommand))
-        self.application.add_handler(CommandHandler('random_film', self.randomFilmCommand))
-        self.application.add_handler(CommandHandler('list_films', self.listFilmsCommand))
-        self.application.add_handler(CommandHandler('remove_film', self.removeFilmCommand))
-        self.application.add_handler(CommandHandler('picture', self.pictureCommand))
-        
-        # send start message to maintainer
-        self.application.job_queue.run_once(self.sendStartMsg, when=5, chat_id=self.config["maintainer_chat_id"])
+            config["token"] = env_token
+        return config
 
-        # daily check for trash cans
-        trash_check_time = toTime(self.config["trash_msg_time"]).replace(tzinfo=pytz.timezone('Europe/Amsterdam')) # place your local timezone here
-        snooze_time = toTimeDelta(self.config["snooze_time"])
-        trash_reminder1_time = datetime.combine(date.today(), trash_check_time) + snooze_time
-        trash_reminder2_time = datetime.combine(date.today(), trash_check_time) + snooze_time * 2
-        
-        self.application.job_queue.run_daily(self.dailyTrashCheck, time=trash_check_time, chat_id=self.config["group_chat_id"], name="dailyTrashCheck") 
-        self.application.job_queue.run_daily(self.reminder, time=trash_reminder1_time, chat_id=self.config["group_chat_id"], name="reminder1")
-        self.application.job_queue.run_daily(self.reminder, time=trash_reminder2_time, chat_id=self.config["group_chat_id"], name="reminder2")                
 
-        # reset flag in case nobody handled the notification
-        self.application.job_queue.run_daily(self.disable, time=toTime("10:00:00").replace(tzinfo=pytz.timezone('Europe/Amsterdam')))
+    def createCamera(self):
+        """Create the camera according to the config."""
+        from camera import Camera
+        return Camera(self.config.get("picture_path", "pictures"),
+                      command=self.config.get("camera_command"),
+                      timeout=self.config.get("camera_timeout", 30),
+                      max_age=self.config.get("picture_max_age", 10),
+                      max_size=self.config.get("picture_max_size"),
+                      quality=self.config.get("picture_quality", 85),
+                      observe=self.metrics.observer("camera"))
+
+
+    def scheduleReminders(self, household, delay=0) -> None:
+        """Plan the reminders of a household after the delay, replacing a pending plan."""
+        for job in self.application.job_queue.get_jobs_by_name(household.name + "/plan"):
+            job.schedule_removal()
+        self.application.job_queue.run_once(self.timedJob(self.planReminders), when=delay, name=household.name + "/plan", data=household.name)
+
+
+    async def planReminders(self, context: CallbackContext) -> None:
+        """Queue one-shot jobs for the reminders of the next days and plan again before they run out."""
+        async with self.registry.lend(self.registry.households[context.job.data]) as household:
+            now = household.now()
+            reminders = plannedReminders(household, now, now + timedelta(days=WINDOW_DAYS))
+
+        job_queue = context.job_queue
+        for job in job_queue.get_jobs_by_name(household.name + "/reminder"):
+            job.schedule_removal()
+
+        callbacks = {TRASH_CHECK: self.trashCheck, REMINDER: self.reminder, DISABLE: self.disable,
+                     BIRTHDAY: self.birthdayCheck, CALENDAR_END: self.calendarEnd}
+        # the job gets its day, it may run after midnight with a late time and the job spread
+        for when, kind, day in reminders:
+            job_queue.run_once(self.timedJob(callbacks[kind]), when=when, chat_id=household.config["group_chat_id"], name=household.name + "/reminder", data=(household.name, day))
+
+        self.scheduleReminders(household, delay=timedelta(days=WINDOW_DAYS - 1))
 
-        # daily birthday check: runs every day at the specified time and checks if today is the birthday of anyone
-        bday_check_time = toTime(self.config["birthday_msg_time"]).replace(tzinfo=pytz.timezone('Europe/Amsterdam'))
-        self.application.job_queue.run_daily(self.dailyBirthdayCheck, time=bday_check_time, chat_id=self.config["group_chat_id"])
-    
 
-    async def dailyBirthdayCheck(self, context: CallbackContext) -> None:
+    async def jobHousehold(self, context: CallbackContext) -> tuple:
+        """Return the loaded household and the day a reminder job was planned for."""
+        name, day = context.job.data
+        return await self.registry.use(self.registry.households[name]), day
+
+
+    async def reloadChangedFiles(self, context: CallbackContext) -> None:
+        """Reload the config, calendar and watchlist files whose mtime or inode changed."""
+        if fileSignature(CONFIG_PATH) != self.file_signatures[CONFIG_PATH]:
+            try:
+                config = await asyncio.to_thread(self.loadConfig)
+            except Exception as e:
+                config = None
+                await self.notifyMaintainer("Reloading " + CONFIG_PATH + " failed: " + str(e))
+            self.file_signatures[CONFIG_PATH] = fileSignature(CONFIG_PATH)
+            if config is not None:
+                camera_changed = any(config.get(key) != self.config.get(key) for key in CAMERA_CONFIG_KEYS)
+                self.config = config
+                self.maintainer_filter.chat_ids = config.get("maintainer_chat_id") or []
+                if camera_changed:
+                    self.camera = None
+
+        new_households = scanHouseholds(self.config, self.store, known=self.registry.households)
+        if new_households:
+            self.registry.add(new_households)
+            for household in new_households:
+                print("Added household " + household.name)
+                self.scheduleReminders(household)
+
+        for household in self.registry:
+            changed = household.changedFiles()
+            if not changed:
+                continue
+            try:
+                reschedule = await household.reload(changed)
+            except Exception as e:
+                # keep the old data and retry once the files change again
+                household.markRead(changed)
+                await self.notifyMaintainer("Reloading " + ", ".join(sorted(changed)) + " failed: " + str(e), household)
+                continue
+
+            print("Reloaded " + ", ".join(sorted(changed)))
+            if household.config_path in changed:
+                self.registry.rebuildIndex()
+            if reschedule:
+                self.scheduleReminders(household)
+
+
+    async def birthdayCheck(self, context: CallbackContext) -> None:
         """Checks if today is the birthday of anyone"""
-        for name, date_str in self.config["birthdays"].items():
-            print("Checking birthday of " + name)
-            date = toDate(date_str)
-            today = datetime.now().date()
-            if date.day == today.day and date.month == today.month:
-                print("Happy Birthday, " + name + "!")
-                notification = "Happy Birthday, " + name + "! " + getRandomAnimalEmoji()
-                await context.bot.send_message(chat_id=context._chat_id, text=notification)
+        household, day = await self.jobHousehold(context)
+        for name, _ in household.birthday_index.today(day):
+            print("Happy Birthday, " + name + "!")
+            notification = "Happy Birthday, " + name + "! " + getRandomAnimalEmoji()
+            await context.bot.send_message(chat_id=context._chat_id, text=notification, rate_limit_args=PRIORITY_REMINDER)
 
 
     async def sendStartMsg(self, context: CallbackContext) -> None:
@@ -102,109 +236,196 @@ class ButlerBot:
         return command_func
 
 
-    async def verifyMessage(self, update: Update, context: ContextTypes.DEFAULT_TYPE, maintainer_only = False, group_only = True, members_only = True, private_chat_only = False, empty_msg_allowed = True) -> bool:
-        """Verifiy that the message is sent by a valid user in the specified chat."""                 
+    async def household(self, update: Update):
+        """Return the loaded household of the chat, if any, else None."""
+        household = self.registry.forChat(update.effective_chat.id)
+        if household is None:
+            return None
+        return await self.registry.use(household)
+
+
+    async def catchUp(self, application: Application) -> None:
+        """Handle the updates sent while the bot was down according to the catch-up policy."""
+        bot = application.bot
+        # getUpdates does not work while a webhook is set, webhook mode sets it again
+        await bot.delete_webhook()
+        backlog = []
+        while True:
+            offset = backlog[-1].update_id + 1 if backlog else None
+            # fetching with a higher offset confirms the previous updates
+            updates = await bot.get_updates(offset=offset, timeout=0)
+            if not updates:
+                break
+            backlog += updates
+
+        updates = selectBacklog(backlog, self.config.get("catch_up", "latest"), self.config.get("catch_up_max_age", 3600))
+        if backlog:
+            print(f"Handling {len(updates)} of {len(backlog)} updates sent while the bot was down")
+        for update in updates:
+            await application.update_queue.put(update)
 
-        if group_only and private_chat_only:
-            raise ValueError("Both group_only and private_chat_only flags cannot be set to True at the same time.")
 
-        # Skip updates that were issued when bot was down
-        # Otherwise, after a restart, the bot would handle all messages that were sent in the meantime
-        then = update.message.date
-        now = datetime.now(pytz.timezone('Europe/Berlin'))        
-        if now - then > timedelta(seconds=5):
-            return False      
-        
-        chat_id = update.effective_chat.id
-        user_id = update.effective_user.id
+    def startBot(self) -> None:
+        """Receive updates via webhook if configured, else start polling."""
+        webhook = self.config.get("webhook") or {}
+        if webhook.get("enabled", False):
+            try:
+                import tornado  # noqa: F401, the webhook server of python-telegram-bot
+            except ImportError:
+                print("Webhook mode needs python-telegram-bot[webhooks], falling back to polling")
+            else:
+                self.runWebhook(webhook)
+                return
+
+        # Polling also removes a webhook left over from webhook mode
+        self.application.run_polling()
 
-        if maintainer_only and chat_id != self.config['maintainer_chat_id']:
-            return False
 
-        if group_only and chat_id != self.config['group_chat_id']:
-            return False
-        
-        if members_only and user_id not in self.config['member_ids']:
-            return False
-        
-        # Only group chats have negative chat ids
-        if private_chat_only and chat_id < 0:
-            return False
-        
-        if not empty_msg_allowed and not context.args:
-            return False
-        
-        return True
+    def runWebhook(self, webhook: dict) -> None:
+        """Serve the webhook with the embedded HTTP server until stopped."""
+        # Telegram sends the secret with every update, requests without it are rejected
+        secret_token = webhook.get("secret_token") or secrets.token_urlsafe(32)
+        self.application.run_webhook(listen=webhook.get("listen", "0.0.0.0"),
+                                     port=webhook.get("port", 8443),
+                                     url_path=webhook.get("path", "telegram"),
+                                     webhook_url=webhook["url"],
+                                     secret_token=secret_token)
 
 
-    def startBot(self) -> None:
-        """Start polling."""
-        self.application.run_polling()
+    def checkTrash(self, household, day) -> tuple:
+        """Return the trash cans due on the day, if any, else an empty tuple."""  
+        return household.waste_events.on(day)
 
 
-    def checkTrash(self) -> str:
-        """Return the trash can due next day, if any, else None."""  
-        # Notify maintainer if the calendar has reached its end
-        if list(self.waste_events)[-1] == date.today():            
-            self.notifyMaintainer("End of calendar reached!")
+    def fileSaved(self, path: str) -> None:
+        """Remember the signature of a file written by the bot so it does not trigger a reload."""
+        for household in self.registry:
+            if path in household.file_signatures:
+                household.markRead([path])
 
-        tomorrow = date.today() + timedelta(days=1)
-        if not tomorrow in self.waste_events.keys():
-            return None
-        
-        return self.waste_events[tomorrow]
+
+    async def postInit(self, application: Application) -> None:
+        """Catch up on missed updates and start the metrics endpoint if configured."""
+        self.profile.mark("initialize")
+        await self.catchUp(application)
+        port = self.config.get("metrics_port")
+        if port:
+            self.metrics_server = await serveMetrics(self.config.get("metrics_listen", "127.0.0.1"), port, self.renderMetrics)
+        self.profile.mark("catch up")
+
+
+    async def startupReport(self, context: CallbackContext) -> None:
+        """Load the households in the background and print how long each startup phase took."""
+        self.profile.mark("polling")
+        # commands arriving meanwhile wait for the data of their household
+        households = list(self.registry)[:self.registry.max_loaded]
+        await asyncio.gather(*(self.registry.use(household) for household in households))
+        self.profile.mark("data")
+        print("Startup profile:\n" + "\n".join(self.profile.report()))
 
 
-    async def notifyMaintainer(self, msg: str) -> None:
-        """Send a private message to the maintainer."""
-        await self.application.bot.send_message(chat_id=self.config["maintainer_chat_id"], text=msg)
+    def renderMetrics(self) -> str:
+        """Return the metrics including the send queue and household gauges."""
+        gauges = [("butler_send_queue", {"stat": stat}, value) for stat, value in sorted(self.send_queue.stats().items())]
+        gauges.append(("butler_households_loaded", {}, sum(household.loaded for household in self.registry)))
+        gauges.append(("butler_households", {}, len(self.registry.households)))
+        return self.metrics.render(gauges)
+
+
+    async def postShutdown(self, application: Application) -> None:
+        """Write pending changes before exiting."""
+        if self.metrics_server:
+            self.metrics_server.close()
+        await self.store.flush()
+        for household in self.registry:
+            if household.loaded:
+                household.unload()
+
+
+    async def sendPages(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, pages: list, parse_mode: str = None) -> None:
+        """Send a single page as is, more pages as one message with prev/next buttons."""
+        if len(pages) == 1:
+            await context.bot.send_message(chat_id=chat_id, text=pages[0], parse_mode=parse_mode)
+            return
+
+        key = self.page_store.add((pages, parse_mode))
+        await context.bot.send_message(chat_id=chat_id, text=pageText(pages, 0), parse_mode=parse_mode, reply_markup=pageKeyboard(key, 0, len(pages)))
+
+
+    async def pageCallback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Show another page of a paged message."""
+        query = update.callback_query
+        household = self.registry.forChat(update.effective_chat.id)
+        if household is None or update.effective_user.id not in household.member_ids:
+            await query.answer()
+            return
+
+        _, key, index = query.data.split(":")
+        stored = self.page_store.get(key)
+        if stored is None or not index.isdigit() or int(index) >= len(stored[0]):
+            await query.answer("This list is outdated, please request it again.")
+            return
+
+        pages, parse_mode = stored
+        index = int(index)
+        await query.answer()
+        await query.edit_message_text(text=pageText(pages, index), parse_mode=parse_mode, reply_markup=pageKeyboard(key, index, len(pages)))
+
+
+    async def notifyMaintainer(self, msg: str, household=None) -> None:
+        """Send a private message to the maintainer of the household, or of the bot if none is given."""
+        config = household.config if household else self.config
+        if not config.get("maintainer_chat_id"):
+            print(msg)
+            return
+        await self.application.bot.send_message(chat_id=config["maintainer_chat_id"], text=msg)
 
 
     async def birthdaysCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """List all stored birthdays with name and date."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
         
-        text = ""
-        for name, bday in self.config["birthdays"].items():
-            text += '\n' + name + "  " + bday
-        if text:
-            text = "All birthdays:" + text
-        else:
-            text = "No entries found."
-        await context.bot.send_message(chat_id=context._chat_id, text=text, parse_mode=constants.ParseMode.HTML)
+        birthdays = household.storage.birthdays()
+        if not birthdays:
+            await context.bot.send_message(chat_id=context._chat_id, text="No entries found.")
+            return
+
+        pages = paginate((name + "  " + bday for name, bday in birthdays.items()), header="All birthdays:")
+        await self.sendPages(context, context._chat_id, pages, parse_mode=constants.ParseMode.HTML)
 
 
     async def cakeCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Pick a random group memmber that has to bake the next cake."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
         
-        candidates = list(self.config['birthdays'].keys())
+        candidates = list(household.storage.birthdays().keys())
         text = "🍰 The next cake will be baked by " + random.choice(candidates) + "!"
-        await context.bot.send_message(chat_id=context._chat_id, text=text)
+        await context.bot.send_message(chat_id=context._chat_id, text=text, rate_limit_args=PRIORITY_CHAT)
 
 
     async def doneCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Disable the trash reminders."""
-        if not await self.verifyMessage(update, context, group_only=True):
+        household = await self.household(update)
+        if not household:
             return        
         
-        if not self.config["waiting_for_disable"]:
-            return
+        # Only the first of several concurrent /done gets thanked
+        async with household.state_lock:
+            if not household.state["waiting_for_disable"]:
+                return
+            household.state["waiting_for_disable"] = False
+            household.saveState()
                 
         msg = "Thanks, " + update.effective_user.first_name + "!"
         await context.bot.send_message(chat_id=context._chat_id, text=msg)
 
-        self.config["waiting_for_disable"] = False
-        saveYAML(CONFIG_PATH, self.config)
-
 
     async def idCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Send a message containing the chat id."""
-        if not await self.verifyMessage(update, context, group_only=False, members_only=False):
-            return
-        
         msg = "This chat's ID is: " + str(update.effective_chat.id) + " " + getRandomAnimalEmoji() + '\n'
         msg += "Your ID is: " + str(update.effective_user.id) + " " + getRandomAnimalEmoji() + '\n'
         msg += "Your name is: " + update.effective_user.first_name + " " + getRandomAnimalEmoji()
@@ -213,45 +434,35 @@ class ButlerBot:
 
     async def nextBirthdayCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Tell the name and date of the next birthday event."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
 
-        bdays = self.config["birthdays"]
-
-        # find next birthday
-        next_name = None
-        next_bday = None
-        min_days_remaining = 444
-        today = datetime.now()
-        for name, birthday in bdays.items():
-            birthday = toDate(birthday)
-            delta1 = datetime(today.year, birthday.month, birthday.day)
-            delta2 = datetime(today.year+1, birthday.month, birthday.day)
-            days_til_this_bday = ((delta1 if delta1 > today else delta2) - today).days
-            if days_til_this_bday < min_days_remaining:
-                next_bday = birthday
-                next_name = name
-                min_days_remaining = days_til_this_bday
+        next_birthdays = household.birthday_index.next(household.today())
+        if not next_birthdays:
+            await context.bot.send_message(chat_id=context._chat_id, text="No entries found.")
+            return
 
+        next_name, next_bday, _ = next_birthdays[0]
         text = "Next birthday: <b>" + next_name + "</b> at <b> " + next_bday.strftime("%d.%m.") + " </b>" + getRandomAnimalEmoji()
         await context.bot.send_message(chat_id=context._chat_id, text=text, parse_mode=constants.ParseMode.HTML)
 
 
     async def nextTrashCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Send the name and date of the next due trash can as a message."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
 
-        next_dates = [event for event in list(self.waste_events) if event > date.today()]
+        next_event = household.waste_events.next_after(household.today())
 
-        if not next_dates:
+        if not next_event:
             text = "No more trash events found! Is the calendar up to date?"
             await context.bot.send_message(chat_id=context._chat_id, text=text)
             return       
          
-        next_date = next_dates[0]        
-        can = self.config["ics_trash_cans"][self.waste_events[next_date]]
-        when = next_date
+        when, cans = next_event
+        can = ", ".join(household.config["ics_trash_cans"][c] for c in cans)
 
         text = "Nächste Mülltonne: <b>" + can + " </b>am <b>" + toGermanWeekday(when) + "</b> Morgen, " + when.strftime("%d.%m.")
         await context.bot.send_message(chat_id=context._chat_id, text=text, parse_mode=constants.ParseMode.HTML)
@@ -259,24 +470,27 @@ class ButlerBot:
 
     async def helloCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send a hello message."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
         msg = "Hello there! " + getRandomAnimalEmoji()
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=msg)
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=msg, rate_limit_args=PRIORITY_CHAT)
 
 
     async def talkCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Talk to the group anonymously."""
-        if not await self.verifyMessage(update, context, group_only=False, private_chat_only=True, empty_msg_allowed=False):
+        household = await self.household(update)
+        if not household or not context.args:
             return        
         
         text = " ".join(context.args)
-        await context.bot.send_message(chat_id=self.config["group_chat_id"], text=text)
+        await context.bot.send_message(chat_id=household.config["group_chat_id"], text=text, rate_limit_args=PRIORITY_CHAT)
 
     
     async def addFilmCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Add a film to the watchlist."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
         
         if not context.args:
@@ -285,45 +499,50 @@ class ButlerBot:
             return        
         
         film = " ".join(context.args)
-        if film in self.watchlist["films"]:
-            text = "Film \"" + film + "\" already in watchlist!"
+        async with household.watchlist_lock:
+            added = household.storage.addFilm(film, added_by=update.effective_user.first_name)
+        if not added:
+            text = "Film \"" + household.storage.findFilm(film) + "\" already in watchlist!"
             await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
             return
-        
-        self.watchlist["films"].append(film)
-        saveYAML(WATCHLIST_PATH, self.watchlist)
 
         text = "Added film \"" + film + "\" to the watchlist"
+        similar = [title for similarity, title in household.storage.searchFilms(film, limit=4)
+                   if title != film and similarity >= SIMILAR_TITLE]
+        if similar:
+            text += "\nSimilar films on it: " + ", ".join("\"" + title + "\"" for title in similar)
         await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
 
     async def randomFilmCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Pick a random film."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
 
-        if not self.watchlist["films"]:
+        text = household.storage.randomFilm()
+        if not text:
             text = "No films on watchlist :("
-        else:
-            text = random.choice(self.watchlist["films"])
         await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
 
     async def listFilmsCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """List all films in watchlist."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
 
-        if not self.watchlist["films"]:
-            text = "---Empty---"
-        else:
-            text = "\n".join(self.watchlist["films"])
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+        films = household.storage.films()
+        if not films:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="---Empty---")
+            return
+        await self.sendPages(context, update.effective_chat.id, paginate(films))
 
 
     async def removeFilmCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Remove a film from the watchlist."""
-        if not await self.verifyMessage(update, context, group_only=False):
+        household = await self.household(update)
+        if not household:
             return
 
         if not context.args:
@@ -332,24 +551,53 @@ class ButlerBot:
             return
         
         film = " ".join(context.args)
-        if not film in self.watchlist["films"]:
+        async with household.watchlist_lock:
+            removed = household.storage.removeFilm(film)
+        # Near matches are only suggested, "Toy Story 2" is close to "Toy Story 3"
+        matches = [] if removed else household.storage.searchFilms(film, limit=3)
+        if removed:
+            text = "Removed \"" + removed + "\" from watchlist"
+        elif matches:
+            text = ("Film \"" + film + "\" not in watchlist! Did you mean " + " or ".join("\"" + title + "\"" for _, title in matches)
+                    + "? Send /remove_film with the exact title to remove it.")
+        else:
             text = "Film \"" + film + "\" not in watchlist! Spelling correct?"
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+    async def findFilmCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Search the watchlist for films similar to a title."""
+        household = await self.household(update)
+        if not household:
+            return
+
+        if not context.args:
+            text = "Usage: /find_film [film title]"
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+            return
+
+        film = " ".join(context.args)
+        matches = household.storage.searchFilms(film, limit=10)
+        if not matches:
+            text = "No film like \"" + film + "\" in watchlist"
         else:
-            self.watchlist["films"].remove(film)
-            saveYAML(WATCHLIST_PATH, self.watchlist)
-            text = "Removed \"" + film + "\" from watchlist"
+            text = "\n".join(title for _, title in matches)
         await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
     async def pictureCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Send a picture from the camera."""
-        if not await self.verifyMessage(update, context, group_only=False, members_only=True):
+        household = await self.household(update)
+        if not household:
             return
         
         self.last_picture_command = datetime.now()
 
         wait_msg = await context.bot.send_message(chat_id=update.effective_chat.id, text="Capturing image...")
 
-        status, status_msg = capture_and_transfer_image(self.config["picture_path"])
+        if self.camera is None:
+            self.camera = self.createCamera()
+        camera = self.camera
+        status, status_msg = await camera.capture()
         if status != 0:
             text = "Error capturing image: " + status_msg
             await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
@@ -360,39 +608,84 @@ class ButlerBot:
 
         # Send the image
         img_path = status_msg
-        await context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(img_path, 'rb'))
+        file_id = camera.file_id(img_path)
+        if file_id:
+            # Same frame as before, Telegram already has it
+            await context.bot.send_photo(chat_id=update.effective_chat.id, photo=file_id)
+            return
+
+        with open(img_path, 'rb') as photo:
+            msg = await context.bot.send_photo(chat_id=update.effective_chat.id, photo=photo)
+        camera.remember_file_id(img_path, msg.photo[-1].file_id)
+
+
+    async def statsCommand(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Send the call counts and latencies of the commands, jobs, API calls and camera to the maintainer."""
+        uptime = timedelta(seconds=int(self.metrics.uptime()))
+        queue = ", ".join(f"{stat} {value}" for stat, value in sorted(self.send_queue.stats().items()))
+        loaded = sum(household.loaded for household in self.registry)
+        lines = ["Uptime " + str(uptime),
+                 "Send queue: " + queue,
+                 f"Households: {loaded} of {len(self.registry.households)} loaded",
+                 f"Started in {self.profile.total():.1f} s",
+                 *self.metrics.summary()]
+        await self.sendPages(context, update.effective_chat.id, paginate(lines))
+
+
+    async def evictPictures(self, context: CallbackContext) -> None:
+        """Delete old pictures according to the configured age and size limits."""
+        max_days = self.config.get("picture_max_days")
+        max_mb = self.config.get("picture_max_mb")
+        if max_days is None and max_mb is None:
+            return
+        from camera import evict_pictures
+        await asyncio.to_thread(evict_pictures, self.config.get("picture_path", "pictures"), max_days, max_mb)
 
 
-    async def dailyTrashCheck(self, context: CallbackContext) -> None:
+    async def trashCheck(self, context: CallbackContext) -> None:
         """Check the trash calendar and sends a message if an event for the next day is found."""
-        current_trash_can = self.checkTrash()
-        if not current_trash_can:
-            print("No trash can found for tomorrow.") 
+        household, day = await self.jobHousehold(context)
+        current_trash_cans = self.checkTrash(household, day)
+        if not current_trash_cans:
+            print("No trash can found for " + str(day) + ".") 
             return
 
-        notification = "Heute Abend bitte rausstellen: " + self.config["ics_trash_cans"][current_trash_can] + getRandomAnimalEmoji()
-        await context.bot.send_message(chat_id=context._chat_id, text=notification)
-        self.config["waiting_for_disable"] = True
-        saveYAML(CONFIG_PATH, self.config)
+        cans = ", ".join(household.config["ics_trash_cans"][can] for can in current_trash_cans)
+        notification = "Heute Abend bitte rausstellen: " + cans + getRandomAnimalEmoji()
+        await context.bot.send_message(chat_id=context._chat_id, text=notification, rate_limit_args=PRIORITY_REMINDER)
+        async with household.state_lock:
+            household.state["waiting_for_disable"] = True
+            household.saveState()
+
+
+    async def calendarEnd(self, context: CallbackContext) -> None:
+        """Notify the maintainer that the calendar has reached its end."""
+        household, day = await self.jobHousehold(context)
+        await self.notifyMaintainer("End of calendar reached! The last collection is on " + day.strftime("%d.%m.%Y") + ".", household)
 
 
     async def reminder(self, context: CallbackContext) -> None:
         """Check if task was fullfilled in the meantime, sends reminder if not."""
-        if not self.config["waiting_for_disable"]:
+        household, _ = await self.jobHousehold(context)
+        if not household.state["waiting_for_disable"]:
             return
         
         text = "Kleine Erinnerung"
-        await context.bot.send_message(chat_id=context._chat_id, text=text)       
+        await context.bot.send_message(chat_id=context._chat_id, text=text, rate_limit_args=PRIORITY_REMINDER)
 
 
     async def disable(self, context: CallbackContext) -> None:
         """Unset the flag."""
-        self.config["waiting_for_disable"] = False
-        saveYAML(CONFIG_PATH, self.config)
+        household, _ = await self.jobHousehold(context)
+        async with household.state_lock:
+            household.state["waiting_for_disable"] = False
+            household.saveState()
 
 
 def main():
-    sir_james_bot = ButlerBot()
+    profile = StartupProfile(STARTED)
+    profile.mark("imports")
+    sir_james_bot = ButlerBot(profile)
     sir_james_bot.startBot()
 
 
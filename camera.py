@@ -1,29 +1,178 @@
-import subprocess
+import asyncio
+from collections import OrderedDict
 import os
+import re
+import time
 from datetime import datetime
 
-def capture_and_transfer_image(path: str) -> (int, str):
+DEFAULT_COMMAND = ["libcamera-still", "-n", "-o", "{output}"]
+
+# Folders and files written by capture_image, the only ones evict_pictures deletes
+DATE_FOLDER = re.compile(r"\d{4}_\d{2}_\d{2}")
+PICTURE_FILE = re.compile(r"image_\d{2}_\d{2}_\d{2}\.jpg")
+
+
+def picture_directory(path: str) -> str:
+    # Relative paths are located in the user's home directory
+    return os.path.join(f"/home/{os.environ.get('USER', '')}", path)
+
+
+def shrink_image(img_path: str, max_size: int, quality: int = 85) -> None:
+    # Downscale and recompress in place, the camera's full resolution is not needed in a chat
+    try:
+        # imported with the first picture, not at startup
+        from PIL import Image
+    except ImportError:
+        print("Pillow is not installed, sending the picture unchanged")
+        return
+    tmp_path = img_path + ".tmp"
+    with Image.open(img_path) as img:
+        img.thumbnail((max_size, max_size))
+        img.save(tmp_path, "JPEG", quality=quality, optimize=True)
+    os.replace(tmp_path, img_path)
+
+
+def evict_pictures(path: str, max_days: float = None, max_mb: float = None) -> int:
+    # Delete pictures older than max_days, then the oldest ones until the directory fits into max_mb.
+    # Only the files written by capture_image are considered, picture_path may hold other files too
+    root = picture_directory(path)
+    if os.path.realpath(root) == os.path.realpath(picture_directory("")):
+        print(f"Not evicting pictures, {root} is the home directory")
+        return 0
+    pictures = []
+    for folder in os.listdir(root) if os.path.isdir(root) else []:
+        folder_path = os.path.join(root, folder)
+        if not DATE_FOLDER.fullmatch(folder) or not os.path.isdir(folder_path):
+            continue
+        for filename in os.listdir(folder_path):
+            if not PICTURE_FILE.fullmatch(filename):
+                continue
+            file_path = os.path.join(folder_path, filename)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            pictures.append((stat.st_mtime, stat.st_size, file_path))
+    pictures.sort()
+
+    total = sum(size for _, size, _ in pictures)
+    oldest_allowed = time.time() - max_days * 86400 if max_days is not None else None
+    removed = 0
+    for mtime, size, file_path in pictures:
+        too_old = oldest_allowed is not None and mtime < oldest_allowed
+        too_big = max_mb is not None and total > max_mb * 1e6
+        if not too_old and not too_big:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    # Remove the emptied date folders
+    for folder in {os.path.dirname(file_path) for _, _, file_path in pictures}:
+        try:
+            if not os.listdir(folder):
+                os.rmdir(folder)
+        except OSError:
+            pass
+
+    if removed:
+        print(f"Removed {removed} old pictures from {root}")
+    return removed
+
+
+async def capture_image(path: str, command: list = None, timeout: float = 30) -> (int, str):
     # Generate timestamp
     timestamp = datetime.now().strftime("%H_%M_%S")
     date = datetime.now().strftime("%Y_%m_%d")
 
-    path_with_date = f"{path}/{date}"
-
-    # Local path to save the image on your laptop
-    absolute_path = f"/home/{os.environ['USER']}/{path_with_date}"
+    absolute_path = os.path.join(picture_directory(path), date)
     os.makedirs(absolute_path, exist_ok=True)
+    img_path = f"{absolute_path}/image_{timestamp}.jpg"
 
-    libcamera_command = ["libcamera-still", "-n", "-o", f"{absolute_path}/image_{timestamp}.jpg"]
+    capture_command = [arg.replace("{output}", img_path) for arg in (command or DEFAULT_COMMAND)]
 
+    print("Capturing image on Raspberry Pi...")
     try:
-        # Connect to Raspberry Pi, capture image
-        print("Capturing image on Raspberry Pi...")
-        subprocess.run(libcamera_command, check=True)
-    except subprocess.CalledProcessError as e:
+        process = await asyncio.create_subprocess_exec(*capture_command)
+    except OSError as e:
         print(f"Error capturing image on Raspberry Pi: {e}")
         return 1, f"Error capturing image on Raspberry Pi: {e}"
+
+    try:
+        returncode = await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        print(f"Capturing image timed out after {timeout} seconds")
+        return 1, f"Capturing image timed out after {timeout} seconds"
+
+    if returncode != 0:
+        print(f"Error capturing image on Raspberry Pi: exit status {returncode}")
+        return 1, f"Error capturing image on Raspberry Pi: exit status {returncode}"
     print("...done!")
 
     # Return success flag and path to image
-    return 0, f"{absolute_path}/image_{timestamp}.jpg"
+    return 0, img_path
+
+
+class Camera:
+    """Shares one capture between concurrent requests and serves recent frames from a cache."""
+
+    MAX_FILE_IDS = 32
+
+    def __init__(self, path: str, command: list = None, timeout: float = 30, max_age: float = 10, max_size: int = None, quality: int = 85, observe=None) -> None:
+        self.path = path
+        self.command = command
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_size = max_size
+        self.quality = quality
+        # called with ("capture", seconds, error) after every capture
+        self.observe = observe
+        self._file_ids = OrderedDict()
+        self._pending = None
+        self._last_frame = None
+        self._last_frame_time = 0.0
+
+    async def capture(self) -> (int, str):
+        # Serve a fresh enough frame without triggering the camera again
+        if self._last_frame and time.monotonic() - self._last_frame_time < self.max_age and os.path.exists(self._last_frame):
+            return 0, self._last_frame
+
+        # Join a capture that is already running
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._capture())
+        return await asyncio.shield(self._pending)
+
+    async def _capture(self) -> (int, str):
+        start = time.perf_counter()
+        try:
+            status, status_msg = await capture_image(self.path, self.command, self.timeout)
+            if self.observe:
+                self.observe("capture", time.perf_counter() - start, status != 0)
+            if status == 0 and self.max_size:
+                try:
+                    await asyncio.to_thread(shrink_image, status_msg, self.max_size, self.quality)
+                except OSError as e:
+                    print(f"Error shrinking image: {e}")
+            if status == 0:
+                # A new capture may reuse the file name of an uploaded one
+                self._file_ids.pop(status_msg, None)
+                self._last_frame = status_msg
+                self._last_frame_time = time.monotonic()
+            return status, status_msg
+        finally:
+            self._pending = None
+
+    def file_id(self, img_path: str) -> str:
+        # Telegram file_id of an image that was already uploaded, if any
+        return self._file_ids.get(img_path)
 
+    def remember_file_id(self, img_path: str, file_id: str) -> None:
+        self._file_ids[img_path] = file_id
+        self._file_ids.move_to_end(img_path)
+        while len(self._file_ids) > self.MAX_FILE_IDS:
+            self._file_ids.popitem(last=False)
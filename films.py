@@ -0,0 +1,89 @@
+"""Trigram index of the watchlist titles for approximate lookup."""
+
+from collections import Counter
+import unicodedata
+
+# Share of the query's trigrams a title needs to be a search result
+MIN_OVERLAP = 0.5
+
+# Similarity from which /add_film points out a film already on the watchlist
+SIMILAR_TITLE = 0.7
+
+
+def normalizeTitle(title: str) -> str:
+    """Return the title without case, accents, punctuation and repeated spaces, e.g. 'Amélie!' -> 'amelie'."""
+    decomposed = unicodedata.normalize('NFKD', title)
+    letters = (" " if not char.isalnum() else char for char in decomposed if not unicodedata.combining(char))
+    normalized = " ".join("".join(letters).casefold().split())
+    # titles made of punctuation only keep it
+    return normalized or " ".join(title.casefold().split())
+
+
+def trigrams(normalized: str) -> set:
+    """Return the trigrams of a normalized title, padded so that short titles and word starts count."""
+    padded = "  " + normalized + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FilmIndex:
+    """Titles by normalized key with a trigram posting list per key, updated on every add and remove."""
+
+    def __init__(self, titles=()) -> None:
+        self._titles = {}
+        self._grams = {}
+        self._postings = {}
+        for title in titles:
+            self.add(title)
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def get(self, title: str) -> str:
+        """Return the stored spelling of a title with the same normalized key, if any, else None."""
+        return self._titles.get(normalizeTitle(title))
+
+    def add(self, title: str) -> bool:
+        """Add a title, return False if one with the same normalized key is already indexed."""
+        key = normalizeTitle(title)
+        if key in self._titles:
+            return False
+        self._titles[key] = title
+        self._grams[key] = grams = trigrams(key)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+        return True
+
+    def remove(self, title: str) -> str:
+        """Remove a title by its normalized key, return the stored spelling, if any, else None."""
+        key = normalizeTitle(title)
+        stored = self._titles.pop(key, None)
+        if stored is None:
+            return None
+        for gram in self._grams.pop(key):
+            posting = self._postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self._postings[gram]
+        return stored
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """Return up to limit (similarity, title) sharing at least MIN_OVERLAP of the query's trigrams, best first.
+
+        The similarity is the Dice coefficient of the trigram sets, 1.0 for the same normalized title.
+        """
+        grams = trigrams(normalizeTitle(query))
+        needed = max(1, round(len(grams) * MIN_OVERLAP))
+        # A result shares at least one of the len - needed + 1 rarest trigrams, only those collect
+        # candidates, the common ones like ' th' just count for them
+        ordered = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))
+        split = len(ordered) - needed + 1
+        hits = Counter()
+        for gram in ordered[:split]:
+            hits.update(self._postings.get(gram, ()))
+        for gram in ordered[split:]:
+            hits.update(hits.keys() & self._postings.get(gram, set()))
+
+        results = [(2 * count / (len(grams) + len(self._grams[key])), self._titles[key])
+                   for key, count in hits.items() if count >= needed]
+        results.sort(key=lambda result: (-result[0], result[1]))
+        return results[:limit]
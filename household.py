@@ -0,0 +1,250 @@
+"""Households served by the bot, each with its own config, calendar, watchlist and birthdays."""
+
+import asyncio
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+import os
+import time
+import zlib
+
+import pytz
+
+from birthdays import BirthdayIndex
+from storage import SQLiteStorage, YAMLStorage
+from utils import fileSignature, loadWasteEvents, loadYAML
+
+CONFIG_FILE = 'config.yaml'
+CALENDAR_FILE = 'waste_calendar.ics'
+WATCHLIST_FILE = 'watchlist.yaml'
+STATE_FILE = 'state.yaml'
+
+DEFAULT_TIMEZONE = 'Europe/Berlin'
+
+# Config keys that decide when the reminders are sent
+SCHEDULE_CONFIG_KEYS = ('trash_msg_time', 'snooze_time', 'birthday_msg_time', 'group_chat_id', 'selected_trash_cans', 'timezone')
+
+
+class Household:
+    """One household with its own files in a directory. The config is read right away,
+    the calendar, watchlist and birthdays only when the household is used."""
+
+    def __init__(self, name: str, directory: str, store, spread: int = 0) -> None:
+        self.name = name
+        self.directory = directory
+        self.store = store
+        self.config_path = os.path.join(directory, CONFIG_FILE)
+        self.calendar_path = os.path.join(directory, CALENDAR_FILE)
+        self.watchlist_path = os.path.join(directory, WATCHLIST_FILE)
+        self.state_path = os.path.join(directory, STATE_FILE)
+        self.setConfig(loadYAML(self.config_path) or {})
+        # spread the daily jobs of many households over up to spread seconds
+        self.offset = timedelta(seconds=zlib.crc32(name.encode()) % (spread + 1))
+        self.file_signatures = {self.config_path: fileSignature(self.config_path)}
+
+        self.loaded = False
+        self.waste_events = None
+        self.watchlist = None
+        self.state = None
+        self.storage = None
+        self.birthday_index = None
+        self.last_used = time.monotonic()
+        # updates are handled concurrently, these guard the shared state
+        self.state_lock = asyncio.Lock()
+        self.watchlist_lock = asyncio.Lock()
+        self._load_lock = asyncio.Lock()
+
+    def setConfig(self, config: dict) -> None:
+        """Use the config and precompute what is looked up for every update."""
+        # an unknown timezone raises before anything is changed
+        self.tz = pytz.timezone(config.get('timezone', DEFAULT_TIMEZONE))
+        self.config = config
+        self.member_ids = frozenset(config.get('member_ids') or ())
+        self.group_chat_id = config.get('group_chat_id')
+
+    def chatIds(self) -> set:
+        """Return the group, maintainer and member chats of the household."""
+        chat_ids = set(self.config.get('member_ids') or [])
+        for key in ('group_chat_id', 'maintainer_chat_id'):
+            if self.config.get(key) is not None:
+                chat_ids.add(self.config[key])
+        return chat_ids
+
+    def now(self) -> datetime:
+        """Return the current time in the household's timezone."""
+        return datetime.now(self.tz)
+
+    def today(self) -> date:
+        """Return the current date in the household's timezone."""
+        return self.now().date()
+
+    async def load(self) -> None:
+        """Load the calendar, watchlist, state and birthdays unless already done."""
+        async with self._load_lock:
+            if self.loaded:
+                return
+            self.waste_events, self.watchlist, self.state = await asyncio.to_thread(self._readFiles)
+            self.storage = self.createStorage()
+            self.birthday_index = BirthdayIndex(self.storage.birthdays())
+            for path in (self.calendar_path, self.watchlist_path):
+                self.file_signatures[path] = fileSignature(path)
+            self.loaded = True
+
+    def unload(self) -> None:
+        """Drop the loaded data, pending writes keep their own reference to it."""
+        if isinstance(self.storage, SQLiteStorage):
+            self.storage.close()
+        self.waste_events = self.watchlist = self.state = self.storage = self.birthday_index = None
+        self.file_signatures = {self.config_path: self.file_signatures[self.config_path]}
+        self.loaded = False
+
+    def _readFiles(self) -> tuple:
+        waste_events = loadWasteEvents(self.calendar_path, self.config['selected_trash_cans'])
+        watchlist = loadYAML(self.watchlist_path)
+        # the runtime state is kept apart from the user's config
+        state = loadYAML(self.state_path) or {}
+        # older versions stored the flag in the config
+        state.setdefault("waiting_for_disable", self.config.get("waiting_for_disable", False))
+        return waste_events, watchlist, state
+
+    def createStorage(self):
+        """Create the watchlist and birthday storage selected in the config."""
+        if self.config.get("storage") != "sqlite":
+            storage = YAMLStorage(self.watchlist, self.config, lambda watchlist: self.store.save(self.watchlist_path, watchlist))
+            # a missing or empty watchlist file is replaced by the storage's one
+            self.watchlist = storage.watchlist
+            return storage
+
+        storage = SQLiteStorage(os.path.join(self.directory, self.config.get("database_path", "butler.db")))
+        if storage.migrate(self.watchlist, self.config.get("birthdays")):
+            print("Imported watchlist and birthdays of " + self.name + " into the database")
+        return storage
+
+    def saveState(self) -> None:
+        """Save the runtime state in the background."""
+        self.store.save(self.state_path, self.state)
+
+    def changedFiles(self) -> set:
+        """Return the files whose mtime or inode changed since they were read, skipping the ones the bot is writing."""
+        return {path for path, signature in self.file_signatures.items()
+                if fileSignature(path) != signature and not self.store.pending(path)}
+
+    def markRead(self, paths) -> None:
+        """Remember the current signatures of the files."""
+        for path in paths:
+            self.file_signatures[path] = fileSignature(path)
+
+    async def reload(self, changed: set) -> bool:
+        """Reload the changed files, return True if the reminders have to be planned again."""
+        config = self.config
+        if self.config_path in changed:
+            config = await asyncio.to_thread(loadYAML, self.config_path) or {}
+        reschedule = self.calendar_path in changed or any(config.get(key) != self.config.get(key) for key in SCHEDULE_CONFIG_KEYS)
+
+        if not self.loaded:
+            self.setConfig(config)
+            self.markRead(changed)
+            return reschedule or self.config_path in changed
+
+        waste_events = self.waste_events
+        if self.calendar_path in changed or config['selected_trash_cans'] != self.config['selected_trash_cans']:
+            waste_events = await asyncio.to_thread(loadWasteEvents, self.calendar_path, config['selected_trash_cans'])
+        watchlist = self.watchlist
+        if self.watchlist_path in changed:
+            watchlist = await asyncio.to_thread(loadYAML, self.watchlist_path)
+            if self.store.pending(self.watchlist_path):
+                # a film was added or removed while reading, it must not be lost, the write wins
+                watchlist = self.watchlist
+                changed = changed - {self.watchlist_path}
+
+        self.setConfig(config)
+        self.waste_events, self.watchlist = waste_events, watchlist
+        if isinstance(self.storage, YAMLStorage):
+            self.storage = self.createStorage()
+        if self.storage.birthdays() != self.birthday_index.source:
+            self.birthday_index = BirthdayIndex(self.storage.birthdays())
+            reschedule = True
+        self.markRead(changed)
+        return reschedule
+
+
+def scanHouseholds(config: dict, store, known=()) -> list:
+    """Return the households of the config, skipping the known ones.
+
+    Without households_dir the bot serves a single household from the working directory,
+    otherwise every subdirectory of households_dir with a config.yaml is a household.
+    """
+    directory = config.get("households_dir")
+    if not directory:
+        return [] if 'default' in known else [Household('default', '', store)]
+
+    households = []
+    for name in sorted(os.listdir(directory)):
+        if name not in known and os.path.isfile(os.path.join(directory, name, CONFIG_FILE)):
+            households.append(Household(name, os.path.join(directory, name), store, config.get("job_spread", 600)))
+    return households
+
+
+class HouseholdRegistry:
+    """Finds the household of a chat and keeps only the recently used households loaded."""
+
+    def __init__(self, households: list, max_loaded: int = 32, min_idle: float = 300) -> None:
+        self.households = {}
+        self.max_loaded = max_loaded
+        self.min_idle = min_idle
+        self._chats = {}
+        self._loaded = OrderedDict()
+        self._lent = Counter()
+        self.add(households)
+
+    def __iter__(self):
+        return iter(list(self.households.values()))
+
+    def add(self, households: list) -> None:
+        for household in households:
+            self.households[household.name] = household
+        self.rebuildIndex()
+
+    def rebuildIndex(self) -> None:
+        """Map the group, maintainer and member chats to their household, e.g. after a config change."""
+        chats = {}
+        for household in self.households.values():
+            for chat_id in household.chatIds():
+                chats.setdefault(chat_id, household)
+        self._chats = chats
+
+    def forChat(self, chat_id: int) -> Household:
+        """Return the household of a chat, if any, else None. Private chats have the id of the user."""
+        return self._chats.get(chat_id)
+
+    async def use(self, household: Household) -> Household:
+        """Load the household if necessary and unload the ones that were idle the longest."""
+        # registered before loading, so a job lending the household meanwhile does not unload it
+        household.last_used = time.monotonic()
+        self._loaded[household.name] = household
+        self._loaded.move_to_end(household.name)
+        await household.load()
+
+        # Households used a moment ago may still be in the middle of a command
+        idle_before = household.last_used - self.min_idle
+        while len(self._loaded) > self.max_loaded:
+            name, idle = next(iter(self._loaded.items()))
+            if idle.last_used > idle_before:
+                break
+            del self._loaded[name]
+            idle.unload()
+        return household
+
+    @asynccontextmanager
+    async def lend(self, household: Household):
+        """Load the household for a background job, it is unloaded again unless a command used it meanwhile."""
+        self._lent[household.name] += 1
+        try:
+            await household.load()
+            yield household
+        finally:
+            self._lent[household.name] -= 1
+            if not self._lent[household.name]:
+                del self._lent[household.name]
+                if household.name not in self._loaded and household.loaded:
+                    household.unload()
@@ -0,0 +1,141 @@
+"""Call counts, latency histograms and errors of handlers, jobs, API calls and the camera, in Prometheus text format."""
+
+import asyncio
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+import time
+
+# Upper bounds in seconds of the latency buckets, anything slower is counted in +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Counts observations per latency bucket, like a Prometheus histogram."""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket holding the q-quantile, inf if beyond the last bucket."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Observations grouped by kind, e.g. command, job, api or camera, and name."""
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.latency = {}
+
+    def uptime(self) -> float:
+        return time.time() - self.started
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False) -> None:
+        key = (kind, name)
+        self.calls[key] += 1
+        if error:
+            self.errors[key] += 1
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram()
+        histogram.observe(seconds)
+
+    def observer(self, kind: str):
+        """Return a callback observe(name, seconds, error) for one kind, e.g. for the send queue."""
+        return lambda name, seconds, error=False: self.observe(kind, name, seconds, error)
+
+    def instrument(self, kind: str, name: str, callback):
+        """Wrap an async callback so that its calls, errors and durations are recorded."""
+        @wraps(callback)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = True
+            try:
+                result = await callback(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                self.observe(kind, name, time.perf_counter() - start, error)
+        return wrapper
+
+    def summary(self) -> list:
+        """Return one line per observed callback with calls, errors, mean and p99 latency."""
+        lines = []
+        for kind, name in sorted(self.latency):
+            histogram = self.latency[kind, name]
+            mean = histogram.total / histogram.count * 1000
+            p99 = histogram.quantile(0.99) * 1000
+            lines.append(f"{kind} {name}: {histogram.count} calls, {self.errors[kind, name]} errors, "
+                         f"{mean:.0f} ms mean, p99 < {p99:.0f} ms")
+        return lines
+
+    def render(self, gauges=()) -> str:
+        """Return all metrics in the Prometheus text format, gauges are (name, labels, value) tuples."""
+        lines = [
+            "# TYPE butler_calls_total counter",
+            *(f'butler_calls_total{{kind="{kind}",name="{name}"}} {count}' for (kind, name), count in sorted(self.calls.items())),
+            "# TYPE butler_errors_total counter",
+            *(f'butler_errors_total{{kind="{kind}",name="{name}"}} {count}' for (kind, name), count in sorted(self.errors.items())),
+            "# TYPE butler_duration_seconds histogram",
+        ]
+        for (kind, name), histogram in sorted(self.latency.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'butler_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'butler_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'butler_duration_seconds_sum{{{labels}}} {histogram.total}')
+            lines.append(f'butler_duration_seconds_count{{{labels}}} {histogram.count}')
+
+        lines.append("# TYPE butler_start_time_seconds gauge")
+        lines.append(f"butler_start_time_seconds {self.started}")
+        typed = set()
+        for name, labels, value in gauges:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+async def serveMetrics(host: str, port: int, render) -> asyncio.AbstractServer:
+    """Serve the text returned by render() to every HTTP GET request, e.g. for Prometheus."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            # the headers are not needed
+            while (await reader.readline()).strip():
+                pass
+            if request_line.startswith(b"GET "):
+                status, body = b"200 OK", render().encode()
+            else:
+                status, body = b"405 Method Not Allowed", b""
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: "
+                         + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,67 @@
+"""Update filters that reject unauthorized updates before they reach a handler, and the catch-up of missed updates."""
+
+from datetime import datetime, timedelta, timezone
+
+from telegram.ext import filters
+
+ANY_CHAT = 'any'
+GROUP_CHAT = 'group'
+PRIVATE_CHAT = 'private'
+
+# What to do with the updates sent while the bot was down
+CATCH_UP_POLICIES = ('drop', 'latest', 'all')
+
+
+class MemberFilter(filters.MessageFilter):
+    """Lets the messages of household members pass, in any chat of their household,
+    only in the household's group or only in private chats."""
+
+    def __init__(self, registry, chat: str = ANY_CHAT) -> None:
+        super().__init__(name=f"MemberFilter({chat})")
+        self.registry = registry
+        self.chat = chat
+
+    def filter(self, message) -> bool:
+        household = self.registry.forChat(message.chat_id)
+        if household is None or message.from_user is None or message.from_user.id not in household.member_ids:
+            return False
+        if self.chat == GROUP_CHAT:
+            return message.chat_id == household.group_chat_id
+        # Only group chats have negative chat ids
+        if self.chat == PRIVATE_CHAT:
+            return message.chat_id > 0
+        return True
+
+
+def _backlogKey(update) -> tuple:
+    """Return what makes two missed updates the same request, e.g. the same command in the same chat."""
+    message = update.message
+    command, _, args = message.text.partition(" ")
+    # /done@butler_bot and /done are the same command
+    return message.chat_id, command.split("@", 1)[0].lower(), " ".join(args.split())
+
+
+def selectBacklog(updates: list, policy: str, max_age: float, now: datetime = None) -> list:
+    """Return the missed updates to handle, in their order.
+
+    drop handles none, all handles every command and latest only the last of repeated
+    identical commands in a chat, e.g. one /done. Updates older than max_age seconds,
+    button presses and messages without a command are dropped in any case.
+    """
+    if policy not in CATCH_UP_POLICIES:
+        raise ValueError(f"Unknown catch_up policy {policy}, expected one of {', '.join(CATCH_UP_POLICIES)}")
+    if policy == 'drop':
+        return []
+
+    oldest = (now or datetime.now(timezone.utc)) - timedelta(seconds=max_age)
+    commands = [update for update in updates
+                if update.message and update.message.text and update.message.text.startswith("/")
+                and update.message.date >= oldest]
+    if policy == 'all':
+        return commands
+
+    latest = {}
+    for update in commands:
+        latest[_backlogKey(update)] = update
+    kept = set(id(update) for update in latest.values())
+    return [update for update in commands if id(update) in kept]
@@ -0,0 +1,77 @@
+"""Split long messages into pages that can be browsed with inline buttons."""
+
+from collections import OrderedDict
+import itertools
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Telegram allows 4096 characters, leave room for the page counter
+MAX_PAGE_LENGTH = 4000
+
+
+def paginate(lines, header: str = None, limit: int = MAX_PAGE_LENGTH) -> list:
+    """Join lines into pages of at most limit characters, repeating the header on every page."""
+    pages = []
+    current = [header] if header else []
+    size = len(header) if header else 0
+    base = size
+
+    cut = limit - base - 1
+    for line in lines:
+        # a single line longer than a page is cut into pieces, each on a page of its own
+        if len(line) > cut and len(current) > (1 if header else 0):
+            pages.append("\n".join(current))
+            current = [header] if header else []
+            size = base
+        while len(line) > cut:
+            pages.append("\n".join(current + [line[:cut]]))
+            line = line[cut:]
+        if size + len(line) + 1 > limit and len(current) > (1 if header else 0):
+            pages.append("\n".join(current))
+            current = [header] if header else []
+            size = base
+        current.append(line)
+        size += len(line) + 1
+
+    if len(current) > (1 if header else 0) or not pages:
+        pages.append("\n".join(current))
+    assert all(len(page) <= limit for page in pages), "page longer than the limit"
+    return pages
+
+
+class PageStore:
+    """Keeps the pages of the most recent paged messages."""
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.capacity = capacity
+        self._pages = OrderedDict()
+        self._ids = itertools.count()
+
+    def add(self, message) -> str:
+        """Store a paged message and return the key to fetch it again."""
+        key = format(next(self._ids), 'x')
+        self._pages[key] = message
+        while len(self._pages) > self.capacity:
+            self._pages.popitem(last=False)
+        return key
+
+    def get(self, key: str):
+        """Return the message stored under the key, if it was not dropped yet, else None."""
+        message = self._pages.get(key)
+        if message is not None:
+            self._pages.move_to_end(key)
+        return message
+
+
+def pageText(pages: list, index: int) -> str:
+    """Return the text of a page including the page counter."""
+    return pages[index] + "\n\n(" + str(index + 1) + "/" + str(len(pages)) + ")"
+
+
+def pageKeyboard(key: str, index: int, total: int) -> InlineKeyboardMarkup:
+    """Return the prev/next buttons for a page."""
+    buttons = []
+    if index > 0:
+        buttons.append(InlineKeyboardButton("« prev", callback_data="page:" + key + ":" + str(index - 1)))
+    if index < total - 1:
+        buttons.append(InlineKeyboardButton("next »", callback_data="page:" + key + ":" + str(index + 1)))
+    return InlineKeyboardMarkup([buttons])
@@ -0,0 +1,71 @@
+"""Write-behind persistence of YAML files."""
+
+import asyncio
+from collections import Counter
+import yaml
+from utils import YAML_DUMPER, writeFileAtomic
+
+# Failed writes are retried with a doubling delay up to MAX_RETRY_DELAY seconds,
+# after RETRY_LIMIT failures in a row the changes of the file are only kept in memory
+RETRY_LIMIT = 8
+MAX_RETRY_DELAY = 300
+
+
+class WriteBehindStore:
+    """Collects changed YAML data and writes it atomically off the event loop after a short delay."""
+
+    def __init__(self, delay: float = 1.0, on_saved=None) -> None:
+        self.delay = delay
+        self.on_saved = on_saved
+        self._dirty = {}
+        self._writing = set()
+        self._failures = Counter()
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def save(self, path: str, data) -> None:
+        """Mark the data of a file as changed, repeated saves within the delay are written once."""
+        self._dirty[path] = data
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._delayedFlush(self.delay))
+
+    def pending(self, path: str) -> bool:
+        """Return True while a write of the file is queued or on its way to the disk."""
+        return path in self._dirty or path in self._writing
+
+    async def flush(self) -> None:
+        """Write all changed files now."""
+        async with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            for path, data in dirty.items():
+                # Serialize on the event loop so the data cannot change while it is written,
+                # libyaml keeps this short even for long watchlists
+                text = yaml.dump(data, Dumper=YAML_DUMPER)
+                # the file changes before on_saved records it, a reload must not take it for an outside edit
+                self._writing.add(path)
+                try:
+                    await asyncio.to_thread(writeFileAtomic, path, text)
+                except OSError as e:
+                    self._failures[path] += 1
+                    if self._failures[path] >= RETRY_LIMIT:
+                        print(f"Could not save {path}: {e}, giving up after {RETRY_LIMIT} attempts")
+                        del self._failures[path]
+                    else:
+                        print(f"Could not save {path}: {e}")
+                        self._dirty.setdefault(path, data)
+                    continue
+                else:
+                    self._failures.pop(path, None)
+                    if self.on_saved:
+                        self.on_saved(path)
+                finally:
+                    self._writing.discard(path)
+
+    async def _delayedFlush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.flush()
+        # failed writes and saves made while writing are retried, failed ones later and later
+        if self._dirty:
+            failures = max(self._failures[path] for path in self._dirty)
+            retry = min(self.delay * 2 ** failures, MAX_RETRY_DELAY)
+            self._task = asyncio.get_running_loop().create_task(self._delayedFlush(retry))
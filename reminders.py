@@ -0,0 +1,70 @@
+"""Reminders of a household computed from its calendar and birthdays, for one-shot jobs."""
+
+from datetime import date, datetime, time, timedelta
+
+from pytz.exceptions import AmbiguousTimeError, NonExistentTimeError
+
+from utils import toTime, toTimeDelta
+
+TRASH_CHECK = 'trashCheck'
+REMINDER = 'reminder'
+DISABLE = 'disable'
+BIRTHDAY = 'birthdayCheck'
+CALENDAR_END = 'calendarEnd'
+
+# Unhandled trash notifications are reset on the collection day
+DISABLE_TIME = time(10, 0)
+
+# Days ahead the reminders are scheduled, the plan is renewed a day before it runs out
+WINDOW_DAYS = 7
+
+
+def localTime(tz, day: date, at: time, offset: timedelta = timedelta()) -> datetime:
+    """Return the wall clock time at on the given day in tz, moved by offset.
+
+    Times that do not exist when the clocks go forward are moved forward by the gap,
+    ambiguous times when the clocks go back take the first of the two.
+    """
+    naive = datetime.combine(day, at) + offset
+    try:
+        return tz.localize(naive, is_dst=None)
+    except AmbiguousTimeError:
+        return tz.localize(naive, is_dst=True)
+    except NonExistentTimeError:
+        return tz.normalize(tz.localize(naive, is_dst=False))
+
+
+def plannedReminders(household, start: datetime, end: datetime) -> list:
+    """Return the sorted (time, kind, day) of the household's reminders with start <= time < end.
+
+    The day is the collection day of the trash reminders, the celebration day of birthdays and the
+    last collection day for the end of the calendar.
+    """
+    config = household.config
+    tz = household.tz
+    first_day = start.astimezone(tz).date() - timedelta(days=1)
+    last_day = end.astimezone(tz).date() + timedelta(days=1)
+
+    trash_time = toTime(config["trash_msg_time"])
+    snooze_time = toTimeDelta(config["snooze_time"])
+    reminders = []
+    # the notification is sent in the evening before the collection
+    for day, _ in household.waste_events.range(first_day, last_day + timedelta(days=1)):
+        evening = day - timedelta(days=1)
+        reminders.append((localTime(tz, evening, trash_time, household.offset), TRASH_CHECK, day))
+        reminders.append((localTime(tz, evening, trash_time, household.offset + snooze_time), REMINDER, day))
+        reminders.append((localTime(tz, evening, trash_time, household.offset + snooze_time * 2), REMINDER, day))
+        reminders.append((localTime(tz, day, DISABLE_TIME, household.offset), DISABLE, day))
+
+    last = household.waste_events.last()
+    if last is not None:
+        reminders.append((localTime(tz, last, trash_time, household.offset), CALENDAR_END, last))
+
+    birthday_time = toTime(config["birthday_msg_time"])
+    celebrated = {when for _, _, when in household.birthday_index.within(first_day, (last_day - first_day).days)}
+    for day in celebrated:
+        reminders.append((localTime(tz, day, birthday_time, household.offset), BIRTHDAY, day))
+
+    reminders = [reminder for reminder in reminders if start <= reminder[0] < end]
+    reminders.sort(key=lambda reminder: reminder[0])
+    return reminders
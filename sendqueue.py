@@ -0,0 +1,229 @@
+"""Central send queue for all outgoing Bot API requests, with flood limits, retries and priorities."""
+
+import asyncio
+from collections import Counter, deque
+from datetime import timedelta
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Lower values are sent first
+PRIORITY_REMINDER = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_CHAT = 2
+
+# Telegram allows about 30 messages per second overall, one per second in a private chat
+# and 20 per minute in a group
+GLOBAL_RATE = 30
+PRIVATE_RATE = 1
+GROUP_RATE = 20 / 60
+GROUP_BURST = 5
+
+
+class TokenBucket:
+    """Allows rate requests per second on average and bursts of up to capacity requests."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Return the seconds until a request may be sent."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        """Send nothing before the given time, e.g. after Telegram asked to retry later."""
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class _Request:
+    __slots__ = ('callback', 'args', 'kwargs', 'endpoint', 'chat_id', 'priority', 'future', 'attempts', 'not_before')
+
+    def __init__(self, callback, args, kwargs, endpoint, chat_id, priority, future) -> None:
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.endpoint = endpoint
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+def _seconds(retry_after) -> float:
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class SendQueue(BaseRateLimiter):
+    """Queues the requests sent to a chat and sends them within the flood limits, most urgent first.
+
+    Pass the priority as rate_limit_args, e.g. send_message(..., rate_limit_args=PRIORITY_REMINDER).
+    Requests that are not bound to a chat, like answering a callback query, are not queued.
+    observe(endpoint, seconds, error) is called with the duration of every API call, if given.
+    """
+
+    def __init__(self, max_retries: int = 5, max_backoff: float = 60, observe=None) -> None:
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.observe = observe
+        self.counters = Counter()
+        self._lanes = [deque() for _ in (PRIORITY_REMINDER, PRIORITY_DEFAULT, PRIORITY_CHAT)]
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._buckets = {}
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self._running = set()
+
+    async def initialize(self) -> None:
+        # Called by the application and again by the updater, one dispatcher is enough
+        if self._dispatcher:
+            return
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for lane in self._lanes:
+            while lane:
+                lane.popleft().future.cancel()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await self._timed(endpoint, callback(*args, **kwargs))
+
+        priority = PRIORITY_DEFAULT if rate_limit_args is None else min(max(rate_limit_args, 0), len(self._lanes) - 1)
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(_Request(callback, args, kwargs, endpoint, chat_id, priority, future))
+        self.counters['queued'] += 1
+        self._wakeup.set()
+        return await future
+
+    async def _timed(self, endpoint: str, call):
+        if self.observe is None:
+            return await call
+        start = time.perf_counter()
+        error = True
+        try:
+            result = await call
+            error = False
+            return result
+        finally:
+            self.observe(endpoint, time.perf_counter() - start, error)
+
+    def stats(self) -> dict:
+        """Return the counters and the current queue lengths."""
+        stats = dict(self.counters)
+        stats['waiting'] = sum(len(lane) for lane in self._lanes)
+        stats['in_flight'] = len(self._running)
+        return stats
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(PRIVATE_RATE, PRIVATE_RATE)
+            else:
+                bucket = TokenBucket(GROUP_RATE, GROUP_BURST)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _next(self, now: float) -> tuple:
+        """Return the first request that may be sent now, else None and the seconds to wait."""
+        wait = self._global.delay(now)
+        if wait > 0:
+            return None, wait
+
+        wait = None
+        waiting_chats = set()
+        for lane in self._lanes:
+            i = 0
+            while i < len(lane):
+                request = lane[i]
+                if request.future.done():
+                    del lane[i]
+                    continue
+                # keep the order within a chat
+                if request.chat_id in waiting_chats:
+                    i += 1
+                    continue
+                delay = max(request.not_before - now, self._bucket(request.chat_id).delay(now))
+                if delay <= 0:
+                    del lane[i]
+                    return request, 0
+                waiting_chats.add(request.chat_id)
+                wait = delay if wait is None else min(wait, delay)
+                i += 1
+        return None, wait
+
+    async def _dispatch(self) -> None:
+        while True:
+            now = time.monotonic()
+            request, wait = self._next(now)
+            if request is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.take()
+            self._bucket(request.chat_id).take()
+            task = asyncio.get_running_loop().create_task(self._send(request))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _send(self, request: _Request) -> None:
+        try:
+            result = await self._timed(request.endpoint, request.callback(*request.args, **request.kwargs))
+        except RetryAfter as e:
+            self.counters['rate_limited'] += 1
+            retry_after = _seconds(e.retry_after)
+            self._bucket(request.chat_id).block(time.monotonic() + retry_after)
+            self._retry(request, retry_after, e)
+        except BadRequest as e:
+            # a malformed request does not get better by sending it again
+            self._fail(request, e)
+        except NetworkError as e:
+            self.counters['network_errors'] += 1
+            self._retry(request, min(2 ** request.attempts, self.max_backoff), e)
+        except Exception as e:
+            self._fail(request, e)
+        else:
+            self.counters['sent'] += 1
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def _retry(self, request: _Request, delay: float, error: Exception) -> None:
+        request.attempts += 1
+        if request.attempts > self.max_retries:
+            self._fail(request, error)
+            return
+        self.counters['retried'] += 1
+        request.not_before = time.monotonic() + delay
+        self._lanes[request.priority].appendleft(request)
+        self._wakeup.set()
+
+    def _fail(self, request: _Request, error: Exception) -> None:
+        self.counters['failed'] += 1
+        if not request.future.done():
+            request.future.set_exception(error)
@@ -0,0 +1,27 @@
+"""Durations of the startup phases, from the first import until all data is loaded."""
+
+import time
+
+
+class StartupProfile:
+    """Records the seconds each phase took, a phase ends when the next one is marked."""
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.last = started
+        self.phases = []
+
+    def mark(self, phase: str) -> None:
+        """End the phase that started at the previous mark."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def total(self) -> float:
+        return self.last - self.started
+
+    def report(self) -> list:
+        """Return one line per phase and the total."""
+        lines = [f"{phase:<12} {seconds * 1000:8.0f} ms" for phase, seconds in self.phases]
+        lines.append(f"{'total':<12} {self.total() * 1000:8.0f} ms")
+        return lines
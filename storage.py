@@ -0,0 +1,203 @@
+"""Storage backends for the watchlist and the birthdays."""
+
+from datetime import datetime, timezone
+import random
+import sqlite3
+
+from films import FilmIndex, normalizeTitle
+
+# Version of titleKey the keys in an SQLite database were computed with
+TITLE_KEY_VERSION = '2'
+
+
+class Storage:
+    """Interface used by the film and birthday commands."""
+
+    def films(self) -> list:
+        """Return all film titles in the order they were added."""
+        raise NotImplementedError
+
+    def findFilm(self, title: str) -> str:
+        """Return the stored spelling of a title, ignoring case, accents and punctuation, if any, else None."""
+        raise NotImplementedError
+
+    def searchFilms(self, title: str, limit: int = 5) -> list:
+        """Return up to limit (similarity, title) of the films similar to a title, best first."""
+        raise NotImplementedError
+
+    def addFilm(self, title: str, added_by: str = None) -> bool:
+        """Add a film, return False if it is already on the watchlist."""
+        raise NotImplementedError
+
+    def removeFilm(self, title: str) -> str:
+        """Remove a film ignoring case, accents and punctuation, return the removed title, if any, else None."""
+        raise NotImplementedError
+
+    def randomFilm(self) -> str:
+        """Return a random film title, if any, else None."""
+        raise NotImplementedError
+
+    def birthdays(self) -> dict:
+        """Return the birthdays as name -> 'dd/mm/YYYY'."""
+        raise NotImplementedError
+
+
+def titleKey(title: str) -> str:
+    """Return the key under which a title is unique, 'The Matrix' and 'the matrix!' are the same film."""
+    return normalizeTitle(title)
+
+
+class YAMLStorage(Storage):
+    """Keeps the watchlist in watchlist.yaml and reads the birthdays from the config."""
+
+    def __init__(self, watchlist: dict, config: dict, save) -> None:
+        self.watchlist = watchlist if watchlist else {}
+        self.watchlist.setdefault("films", [])
+        self.config = config
+        self.save = save
+        # built on the first film command, then kept up to date
+        self._index = None
+
+    def _filmIndex(self) -> FilmIndex:
+        if self._index is None:
+            self._index = FilmIndex(self.watchlist["films"])
+        return self._index
+
+    def films(self) -> list:
+        return list(self.watchlist["films"])
+
+    def findFilm(self, title: str) -> str:
+        return self._filmIndex().get(title)
+
+    def searchFilms(self, title: str, limit: int = 5) -> list:
+        return self._filmIndex().search(title, limit)
+
+    def addFilm(self, title: str, added_by: str = None) -> bool:
+        if not self._filmIndex().add(title):
+            return False
+        self.watchlist["films"].append(title)
+        self.save(self.watchlist)
+        return True
+
+    def removeFilm(self, title: str) -> str:
+        film = self._filmIndex().remove(title)
+        if film is None:
+            return None
+        self.watchlist["films"].remove(film)
+        self.save(self.watchlist)
+        return film
+
+    def randomFilm(self) -> str:
+        films = self.watchlist["films"]
+        return random.choice(films) if films else None
+
+    def birthdays(self) -> dict:
+        return self.config.get("birthdays") or {}
+
+
+class SQLiteStorage(Storage):
+    """Keeps the watchlist and the birthdays in an SQLite database."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS films (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            title_key TEXT NOT NULL UNIQUE,
+            added_at TEXT NOT NULL,
+            added_by TEXT
+        );
+        CREATE TABLE IF NOT EXISTS birthdays (
+            name TEXT PRIMARY KEY,
+            birthday TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        self._updateTitleKeys()
+        # built on the first search, then kept up to date
+        self._index = None
+
+    def _updateTitleKeys(self) -> None:
+        """Recompute the title keys of databases written with an older titleKey."""
+        with self.connection:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'title_key_version'").fetchone()
+            if row and row[0] == TITLE_KEY_VERSION:
+                return
+            for film_id, title, key in self.connection.execute("SELECT id, title, title_key FROM films").fetchall():
+                if titleKey(title) != key:
+                    # titles that now collide keep their old key, they are still found by searchFilms
+                    self.connection.execute("UPDATE OR IGNORE films SET title_key = ? WHERE id = ?", (titleKey(title), film_id))
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('title_key_version', ?)", (TITLE_KEY_VERSION,))
+
+    def migrate(self, watchlist: dict, birthdays: dict) -> bool:
+        """Import the YAML watchlist and the config birthdays once, return True if it happened now."""
+        with self.connection:
+            if self.connection.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                return False
+            now = _now()
+            for film in (watchlist or {}).get("films") or []:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO films (title, title_key, added_at) VALUES (?, ?, ?)",
+                    (film, titleKey(film), now))
+            for name, birthday in (birthdays or {}).items():
+                self.connection.execute("INSERT OR REPLACE INTO birthdays (name, birthday) VALUES (?, ?)", (name, birthday))
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (now,))
+        return True
+
+    def films(self) -> list:
+        return [row[0] for row in self.connection.execute("SELECT title FROM films ORDER BY id")]
+
+    def findFilm(self, title: str) -> str:
+        row = self.connection.execute("SELECT title FROM films WHERE title_key = ?", (titleKey(title),)).fetchone()
+        return row[0] if row else None
+
+    def searchFilms(self, title: str, limit: int = 5) -> list:
+        if self._index is None:
+            self._index = FilmIndex(self.films())
+        return self._index.search(title, limit)
+
+    def addFilm(self, title: str, added_by: str = None) -> bool:
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO films (title, title_key, added_at, added_by) VALUES (?, ?, ?, ?)",
+                    (title, titleKey(title), _now(), added_by))
+        except sqlite3.IntegrityError:
+            return False
+        if self._index is not None:
+            self._index.add(title)
+        return True
+
+    def removeFilm(self, title: str) -> str:
+        with self.connection:
+            row = self.connection.execute("SELECT id, title FROM films WHERE title_key = ?", (titleKey(title),)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("DELETE FROM films WHERE id = ?", (row[0],))
+        if self._index is not None:
+            self._index.remove(row[1])
+        return row[1]
+
+    def randomFilm(self) -> str:
+        count = self.connection.execute("SELECT COUNT(*) FROM films").fetchone()[0]
+        if not count:
+            return None
+        return self.connection.execute("SELECT title FROM films LIMIT 1 OFFSET ?", (random.randrange(count),)).fetchone()[0]
+
+    def birthdays(self) -> dict:
+        return dict(self.connection.execute("SELECT name, birthday FROM birthdays ORDER BY rowid"))
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
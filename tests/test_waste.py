@@ -0,0 +1,131 @@
+"""Compare the lazy expansion of recurring collections against dateutil on generated calendars."""
+
+from datetime import date, datetime, timedelta
+import os
+import random
+
+import pytest
+from dateutil.rrule import rrulestr
+
+from utils import loadWasteEvents
+import waste
+
+SELECTED = ["BIO", "PPK", "RM1"]
+# the eager reference expands this far
+HORIZON = date(2060, 1, 1)
+
+
+def generateEvents(rng: random.Random) -> list:
+    """Return (can, dtstart, rrule, rdates, exdates) of random recurring collections."""
+    events = []
+    for can in SELECTED + ["WET"]:
+        start = date(2024, 1, 1) + timedelta(days=rng.randrange(60))
+        dtstart = datetime.combine(start, datetime.min.time()) + timedelta(hours=rng.choice([0, 6]))
+        interval = rng.choice([1, 2, 4])
+        rule = f"FREQ=WEEKLY;INTERVAL={interval}"
+        end = rng.choice(["", "count", "until"])
+        if end == "count":
+            rule += f";COUNT={rng.randrange(10, 400)}"
+        elif end == "until":
+            rule += f";UNTIL={start.year + rng.randrange(1, 20)}1231T235959Z"
+        # collections on holidays move to the next day
+        exdates = sorted({start + timedelta(weeks=interval * rng.randrange(200)) for _ in range(rng.randrange(5))})
+        rdates = [day + timedelta(days=1) for day in exdates]
+        events.append((can, dtstart, rule, rdates, exdates))
+    # a monthly collection that only exists as a list of dates
+    events.append(("PPK", datetime(2024, 1, 15), "", [date(2024, month, 15) for month in range(2, 13)], []))
+    # and a few single collections
+    for _ in range(3):
+        events.append((rng.choice(SELECTED), datetime(2025, 1, 1) + timedelta(days=rng.randrange(3000)), "", [], []))
+    return events
+
+
+def writeCalendar(path: str, events: list) -> None:
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//TelegramButler//tests//EN"]
+    for i, (can, dtstart, rule, rdates, exdates) in enumerate(events):
+        value = f"DTSTART;VALUE=DATE:{dtstart:%Y%m%d}" if not dtstart.hour else f"DTSTART;TZID=Europe/Berlin:{dtstart:%Y%m%dT%H%M%S}"
+        lines += ["BEGIN:VEVENT", f"UID:{i}@tests", value, f"SUMMARY:{can}", f"DESCRIPTION:{can} Abfuhr"]
+        if rule:
+            lines.append("RRULE:" + rule)
+        if rdates:
+            lines.append("RDATE;VALUE=DATE:" + ",".join(f"{day:%Y%m%d}" for day in rdates))
+        for day in exdates:
+            lines.append(f"EXDATE;VALUE=DATE:{day:%Y%m%d}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    with open(path, 'w', newline='') as f:
+        f.write("\r\n".join(lines) + "\r\n")
+
+
+def expandEagerly(events: list) -> dict:
+    """Return {date: set of cans} of all collections before HORIZON."""
+    by_day = {}
+    for can, dtstart, rule, rdates, exdates in events:
+        if can not in SELECTED:
+            continue
+        days = {dtstart.date(), *rdates}
+        if rule:
+            rule = rrulestr(rule.replace("Z", ""), dtstart=dtstart)
+            days.update(when.date() for when in rule.between(dtstart, datetime.combine(HORIZON, datetime.min.time()), inc=True))
+        for day in days - set(exdates):
+            if day < HORIZON:
+                by_day.setdefault(day, set()).add(can)
+    return by_day
+
+
+def check(schedule, expected: dict, rng: random.Random) -> None:
+    days = sorted(expected)
+    got = {day: set(cans) for day, cans in schedule.range(date(2000, 1, 1), HORIZON)}
+    assert got == expected, "range differs"
+    assert schedule.first() == days[0]
+    for _ in range(200):
+        day = date(2023, 1, 1) + timedelta(days=rng.randrange((HORIZON - date(2023, 1, 1)).days - 400))
+        assert set(schedule.on(day)) == expected.get(day, set()), day
+        following = next((d for d in days if d > day), None)
+        result = schedule.next_after(day)
+        if following is None:
+            assert result is None or result[0] >= HORIZON, day
+        else:
+            assert result[0] == following and set(result[1]) == expected[following], day
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_expands_like_dateutil(tmp_path, seed):
+    rng = random.Random(seed)
+    events = generateEvents(rng)
+    ics_path = str(tmp_path / "waste_calendar.ics")
+    cache_path = str(tmp_path / ".waste_calendar.ics.cache")
+    writeCalendar(ics_path, events)
+    expected = expandEagerly(events)
+
+    check(loadWasteEvents(ics_path, SELECTED, cache_path), expected, rng)
+    # the cache keeps the rules, not the expanded dates
+    assert os.path.exists(cache_path)
+    check(loadWasteEvents(ics_path, SELECTED, cache_path), expected, rng)
+
+
+def test_touched_calendar_is_hashed_once(tmp_path, monkeypatch):
+    ics_path = str(tmp_path / "waste_calendar.ics")
+    cache_path = str(tmp_path / ".waste_calendar.ics.cache")
+    writeCalendar(ics_path, generateEvents(random.Random(0)))
+    loadWasteEvents(ics_path, SELECTED, cache_path)
+    os.utime(ics_path, (1, 1))
+
+    digests = []
+    fileDigest = waste._fileDigest
+    monkeypatch.setattr(waste, "_fileDigest", lambda path: digests.append(path) or fileDigest(path))
+    for _ in range(3):
+        assert waste.loadWasteCache(cache_path, ics_path, SELECTED) is not None
+    assert len(digests) == 1
+
+
+def test_changed_calendar_misses_the_cache(tmp_path):
+    ics_path = str(tmp_path / "waste_calendar.ics")
+    cache_path = str(tmp_path / ".waste_calendar.ics.cache")
+    writeCalendar(ics_path, generateEvents(random.Random(0)))
+    loadWasteEvents(ics_path, SELECTED, cache_path)
+    stat = os.stat(ics_path)
+    writeCalendar(ics_path, generateEvents(random.Random(1)))
+    os.utime(ics_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert waste.loadWasteCache(cache_path, ics_path, SELECTED) is None
@@ -1,11 +1,15 @@
 """Utility functions for date and time conversion, handling config files etc."""
 
 from datetime import date, timedelta, time, datetime
-import icalendar
+import errno
 import os
 import random
 import yaml
-import os
+from waste import WasteSchedule, loadWasteCache, saveWasteCache, streamWasteEvents
+
+# The same loader backed by libyaml if PyYAML was built with it, several times faster on long watchlists
+YAML_LOADER = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+YAML_DUMPER = getattr(yaml, 'CDumper', yaml.Dumper)
 
 
 def loadYAML(path: str) -> list:
@@ -13,31 +17,70 @@ def loadYAML(path: str) -> list:
     if not os.path.exists(path):
         return []
     with open(path, 'r') as yamlfile:
-        data = yaml.load(yamlfile, Loader=yaml.FullLoader)        
+        data = yaml.load(yamlfile, Loader=YAML_LOADER)        
     return data
 
 
 def saveYAML(path: str, config: list):
     """Save the YAML config."""
-    with open(path, 'w') as yamlfile:
-        yaml.dump(config, yamlfile)
-
-
-def loadWasteEvents(path: str, selected_trash_cans: list) -> dict:
-    """Load an ics file and return a dict with the events."""
-    e = open(path, 'rb')
-    ecal = icalendar.Calendar.from_ical(e.read())
-
-    events = {}        
-    for component in ecal.walk():
-        if not component.name == 'VEVENT':
-            continue
-        description = component.get('description')[:3]
-        if description not in selected_trash_cans:
-            continue            
-        events[component.get('dtstart').dt] = description
-            
-    return events
+    writeFileAtomic(path, yaml.dump(config, Dumper=YAML_DUMPER))
+
+
+def writeFileAtomic(path: str, text: str) -> None:
+    """Write a file via a temporary file and a rename, so it is never left half written.
+
+    A file bind-mounted on its own, e.g. by docker compose, cannot be replaced and is rewritten in place.
+    """
+    tmp_path = path + '.tmp'
+    _writeSynced(tmp_path, text)
+    try:
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+        _writeSynced(path, text)
+        os.remove(tmp_path)
+
+
+def _writeSynced(path: str, text: str) -> None:
+    with open(path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def fileSignature(path: str) -> tuple:
+    """Return (inode, mtime, size) of a file to detect changes, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def loadWasteEvents(path: str, selected_trash_cans: list, cache_path: str = None) -> WasteSchedule:
+    """Load an ics file and return a schedule with the events, reusing the parse cache if the file is unchanged."""
+    if cache_path is None:
+        cache_path = wasteCachePath(path)
+
+    schedule = loadWasteCache(cache_path, path, selected_trash_cans)
+    if schedule is not None:
+        return schedule
+
+    with open(path, 'rb') as e:
+        schedule = WasteSchedule(*streamWasteEvents(e, selected_trash_cans))
+
+    try:
+        saveWasteCache(cache_path, path, selected_trash_cans, schedule)
+    except OSError as e:
+        print(f"Could not write calendar cache {cache_path}: {e}")
+    return schedule
+
+
+def wasteCachePath(path: str) -> str:
+    """Return the default parse cache location for an ics file."""
+    head, tail = os.path.split(path)
+    return os.path.join(head, '.' + tail + '.cache')
 
 
 def toTime(time: str) -> time:
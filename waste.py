@@ -0,0 +1,388 @@
+"""Sorted, array-backed schedule of waste collection dates and a streaming, cached ics reader."""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, datetime
+import hashlib
+import json
+import os
+import re
+
+from dateutil.rrule import rrulestr
+
+# Recurring events are expanded in windows of this many days, the most recently used ones are kept
+WINDOW_DAYS = 366
+MAX_WINDOWS = 8
+# Searches in recurring events without an end give up this many windows ahead
+MAX_SEARCH_WINDOWS = 50
+
+
+_UTC_UNTIL = re.compile(r'(UNTIL=\d{8}(?:T\d{6})?)Z', re.IGNORECASE)
+
+
+class Recurrence:
+    """A recurring collection given by RRULEs, RDATEs and EXDATEs, expanded on demand."""
+
+    def __init__(self, can: str, dtstart: datetime, rules=(), rdates=(), exdates=()) -> None:
+        self.can = can
+        self.dtstart = dtstart
+        self.rules = tuple(rules)
+        # DTSTART is always the first occurrence, even if the rule does not match it
+        self.rdates = tuple(sorted({dtstart.date(), *rdates}))
+        self.exdates = frozenset(exdates)
+        # the dates are naive, so is UNTIL
+        self._rules = [rrulestr(_UTC_UNTIL.sub(r'\1', rule), dtstart=dtstart) for rule in self.rules]
+        self._last = False
+
+    def between(self, start: date, end: date) -> list:
+        """Return the sorted dates of the occurrences with start <= date < end."""
+        days = set(self.rdates[bisect_left(self.rdates, start):bisect_left(self.rdates, end)])
+        after = datetime.combine(start, datetime.min.time())
+        before = datetime.combine(end, datetime.min.time())
+        for rule in self._rules:
+            days.update(when.date() for when in rule.between(after, before, inc=True) if when < before)
+        return sorted(days - self.exdates)
+
+    def last(self) -> date:
+        """Return the date of the last occurrence, None if the recurrence never ends."""
+        if self._last is False:
+            if any('COUNT=' not in rule.upper() and 'UNTIL=' not in rule.upper() for rule in self.rules):
+                self._last = None
+            else:
+                # the occurrences are finite here, but the last ones may be excluded
+                days = set(self.rdates)
+                for rule in self._rules:
+                    days.update(when.date() for when in rule)
+                days -= self.exdates
+                self._last = max(days) if days else self.dtstart.date()
+        return self._last
+
+
+class WasteSchedule:
+    """Collection dates kept as sorted ordinals with the trash cans due on each date.
+
+    Recurring events are expanded window by window when a query reaches them, so calendars
+    with open-ended recurrences do not materialize decades of dates. len() and iteration
+    cover the single events only.
+    """
+
+    def __init__(self, events=(), recurrences=()) -> None:
+        by_day = {}
+        for day, can in events:
+            if isinstance(day, datetime):
+                day = day.date()
+            cans = by_day.setdefault(day.toordinal(), [])
+            if can not in cans:
+                cans.append(can)
+
+        self._ordinals = array('l', sorted(by_day))
+        self._cans = [tuple(by_day[ordinal]) for ordinal in self._ordinals]
+        self.recurrences = list(recurrences)
+        self._windows = OrderedDict()
+
+        # the first and last date of the recurrences, the last is None if one never ends
+        self._recurring_start = self._recurring_end = None
+        if self.recurrences:
+            self._recurring_start = min(recurrence.dtstart.date() for recurrence in self.recurrences)
+            ends = [recurrence.last() for recurrence in self.recurrences]
+            self._recurring_end = None if None in ends else max(ends)
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def __iter__(self):
+        return (date.fromordinal(ordinal) for ordinal in self._ordinals)
+
+    def single(self) -> list:
+        """Return (date, cans) of the single, not recurring events."""
+        return [(date.fromordinal(ordinal), cans) for ordinal, cans in zip(self._ordinals, self._cans)]
+
+    def __contains__(self, day: date) -> bool:
+        return bool(self.on(day))
+
+    def first(self) -> date:
+        """Return the earliest collection date, if any, else None."""
+        if self.recurrences:
+            first = self.next_after(date.min)
+            return first[0] if first else None
+        return date.fromordinal(self._ordinals[0]) if self._ordinals else None
+
+    def last(self) -> date:
+        """Return the latest collection date, if any, else None. Also None if a recurrence never ends."""
+        last = date.fromordinal(self._ordinals[-1]) if self._ordinals else None
+        if self.recurrences:
+            if self._recurring_end is None:
+                return None
+            last = max(last or date.min, self._recurring_end)
+        return last
+
+    def on(self, day: date) -> tuple:
+        """Return the trash cans due on the given date."""
+        ordinal = day.toordinal()
+        i = bisect_left(self._ordinals, ordinal)
+        cans = self._cans[i] if i < len(self._ordinals) and self._ordinals[i] == ordinal else ()
+        if self.recurrences:
+            ordinals, window_cans = self._window(ordinal // WINDOW_DAYS)
+            i = bisect_left(ordinals, ordinal)
+            if i < len(ordinals) and ordinals[i] == ordinal:
+                cans = _mergeCans(cans, window_cans[i])
+        return cans
+
+    def next_after(self, day: date) -> tuple:
+        """Return (date, cans) of the first collection strictly after the given date, if any, else None."""
+        ordinal = day.toordinal()
+        i = bisect_right(self._ordinals, ordinal)
+        result = (self._ordinals[i], self._cans[i]) if i < len(self._ordinals) else None
+
+        if self.recurrences:
+            index = max(ordinal, self._recurring_start.toordinal() - 1) // WINDOW_DAYS
+            last = index + MAX_SEARCH_WINDOWS
+            if self._recurring_end is not None:
+                last = min(last, self._recurring_end.toordinal() // WINDOW_DAYS)
+            if result is not None:
+                last = min(last, result[0] // WINDOW_DAYS)
+            while index <= last:
+                ordinals, cans = self._window(index)
+                i = bisect_right(ordinals, ordinal)
+                if i < len(ordinals):
+                    if result is None or ordinals[i] < result[0]:
+                        result = (ordinals[i], cans[i])
+                    elif ordinals[i] == result[0]:
+                        result = (result[0], _mergeCans(result[1], cans[i]))
+                    break
+                index += 1
+
+        if result is None:
+            return None
+        return date.fromordinal(result[0]), result[1]
+
+    def range(self, start: date, end: date) -> list:
+        """Return (date, cans) of all collections with start <= date < end.
+
+        Recurrences without an end are expanded at most MAX_SEARCH_WINDOWS windows past start.
+        """
+        lo = bisect_left(self._ordinals, start.toordinal())
+        hi = bisect_left(self._ordinals, end.toordinal(), lo)
+        by_day = {self._ordinals[i]: self._cans[i] for i in range(lo, hi)}
+
+        if self.recurrences:
+            first = max(start, self._recurring_start).toordinal()
+            stop = end.toordinal()
+            if self._recurring_end is not None:
+                stop = min(stop, self._recurring_end.toordinal() + 1)
+            else:
+                stop = min(stop, (first // WINDOW_DAYS + MAX_SEARCH_WINDOWS) * WINDOW_DAYS)
+            for index in range(first // WINDOW_DAYS, (stop - 1) // WINDOW_DAYS + 1):
+                ordinals, cans = self._window(index)
+                for i in range(bisect_left(ordinals, first), bisect_left(ordinals, stop)):
+                    by_day[ordinals[i]] = _mergeCans(by_day.get(ordinals[i], ()), cans[i])
+
+        return [(date.fromordinal(ordinal), by_day[ordinal]) for ordinal in sorted(by_day)]
+
+    def _window(self, index: int) -> tuple:
+        """Return the sorted ordinals and cans of the recurring collections in a window, expanding it if needed."""
+        window = self._windows.get(index)
+        if window is not None:
+            self._windows.move_to_end(index)
+            return window
+
+        start = date.fromordinal(max(index * WINDOW_DAYS, 1))
+        end = date.fromordinal(min((index + 1) * WINDOW_DAYS, date.max.toordinal()))
+        by_day = {}
+        for recurrence in self.recurrences:
+            for day in recurrence.between(start, end):
+                cans = by_day.setdefault(day.toordinal(), [])
+                if recurrence.can not in cans:
+                    cans.append(recurrence.can)
+
+        ordinals = array('l', sorted(by_day))
+        window = (ordinals, [tuple(by_day[ordinal]) for ordinal in ordinals])
+        self._windows[index] = window
+        if len(self._windows) > MAX_WINDOWS:
+            self._windows.popitem(last=False)
+        return window
+
+
+def _mergeCans(cans: tuple, more: tuple) -> tuple:
+    return cans + tuple(can for can in more if can not in cans)
+
+
+def _unfoldLines(stream):
+    """Yield the logical content lines of an ics stream, joining folded continuation lines."""
+    current = None
+    for raw in stream:
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _splitProperty(line: str) -> tuple:
+    """Split a content line into its upper-cased name and its value, dropping any parameters."""
+    if '"' not in line:
+        head, _, value = line.partition(':')
+        return head.split(';', 1)[0].upper(), value
+
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            return line[:i].split(';', 1)[0].upper(), line[i + 1:]
+    return line.upper(), ''
+
+
+def _parseDate(value: str) -> date:
+    """Return the date part of an ics DATE or DATE-TIME value."""
+    return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+
+def _parseDateTime(value: str) -> datetime:
+    """Return an ics DATE or DATE-TIME value as naive datetime, ignoring its timezone."""
+    day = _parseDate(value)
+    if value[8:9].upper() != 'T':
+        return datetime(day.year, day.month, day.day)
+    return datetime(day.year, day.month, day.day, int(value[9:11]), int(value[11:13]), int(value[13:15]))
+
+
+def _parseDateList(value: str) -> list:
+    """Return the dates of a comma separated RDATE or EXDATE value, periods count by their start."""
+    return [_parseDate(item.split('/', 1)[0]) for item in value.split(',') if item]
+
+
+def _unescapeText(value: str) -> str:
+    """Undo the ics TEXT escaping."""
+    return (value.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',')
+            .replace('\\;', ';').replace('\\\\', '\\'))
+
+
+def streamWasteEvents(stream, selected_trash_cans) -> tuple:
+    """Read the VEVENTs of an ics byte stream line by line.
+
+    Return (date, can) pairs of the single events and the recurring events of the selected cans.
+    """
+    selected = frozenset(selected_trash_cans)
+    events = []
+    recurrences = []
+    stack = []
+    dtstart = can = None
+    rules, rdates, exdates = [], [], []
+    skip = False
+
+    for line in _unfoldLines(stream):
+        name, value = _splitProperty(line)
+        if name == 'BEGIN':
+            stack.append(value.upper())
+            if value.upper() == 'VEVENT':
+                dtstart = can = None
+                rules, rdates, exdates = [], [], []
+                skip = False
+            continue
+        if name == 'END':
+            component = stack.pop() if stack else None
+            if component == 'VEVENT' and not skip and dtstart and can:
+                if rules or rdates:
+                    recurrences.append(Recurrence(can, dtstart, rules, rdates, exdates))
+                else:
+                    events.append((dtstart.date(), can))
+            continue
+        if skip or not stack or stack[-1] != 'VEVENT':
+            continue
+
+        if name == 'DESCRIPTION':
+            can = _unescapeText(value)[:3]
+            skip = can not in selected
+        elif name == 'DTSTART':
+            dtstart = _parseDateTime(value)
+        elif name == 'RRULE':
+            rules.append(value)
+        elif name == 'RDATE':
+            rdates += _parseDateList(value)
+        elif name == 'EXDATE':
+            exdates += _parseDateList(value)
+
+    return events, recurrences
+
+
+CACHE_VERSION = 2
+
+
+def _fileDigest(path: str) -> str:
+    """Return the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _writeCache(cache_path: str, cache: dict) -> None:
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+
+def loadWasteCache(cache_path: str, ics_path: str, selected_trash_cans) -> WasteSchedule:
+    """Return the cached schedule if it was built from the current ics file and selection, else None."""
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get('version') != CACHE_VERSION or cache.get('selected') != sorted(selected_trash_cans):
+        return None
+    # mtime and size are a cheap first check, a file replaced with its mtime kept (cp -p, rsync -t)
+    # usually differs in size, then the hash decides, which also catches touched but unchanged files
+    stat = os.stat(ics_path)
+    if (cache.get('mtime_ns'), cache.get('size')) != (stat.st_mtime_ns, stat.st_size):
+        if cache.get('sha256') != _fileDigest(ics_path):
+            return None
+        # same content, key the cache by the new mtime so the next load skips the hash
+        cache['mtime_ns'], cache['size'] = stat.st_mtime_ns, stat.st_size
+        try:
+            _writeCache(cache_path, cache)
+        except OSError:
+            pass
+
+    cans = cache['cans']
+    flat = cache['events']
+    recurrences = [Recurrence(can, datetime.fromisoformat(dtstart), rules, map(date.fromordinal, rdates), map(date.fromordinal, exdates))
+                   for can, dtstart, rules, rdates, exdates in cache['recurrences']]
+    return WasteSchedule(((date.fromordinal(flat[i]), cans[flat[i + 1]]) for i in range(0, len(flat), 2)), recurrences)
+
+
+def saveWasteCache(cache_path: str, ics_path: str, selected_trash_cans, schedule: WasteSchedule) -> None:
+    """Write the schedule to a compact cache file keyed by the ics mtime, size and hash.
+
+    Recurring events are stored unexpanded.
+    """
+    single = schedule.single()
+    cans = sorted({can for _, day_cans in single for can in day_cans})
+    index = {can: i for i, can in enumerate(cans)}
+    flat = []
+    for day, day_cans in single:
+        for can in day_cans:
+            flat += [day.toordinal(), index[can]]
+    recurrences = [[recurrence.can, recurrence.dtstart.isoformat(), list(recurrence.rules),
+                    [day.toordinal() for day in recurrence.rdates], sorted(day.toordinal() for day in recurrence.exdates)]
+                   for recurrence in schedule.recurrences]
+
+    cache = {
+        'version': CACHE_VERSION,
+        'mtime_ns': os.stat(ics_path).st_mtime_ns,
+        'size': os.stat(ics_path).st_size,
+        'sha256': _fileDigest(ics_path),
+        'selected': sorted(selected_trash_cans),
+        'cans': cans,
+        'events': flat,
+        'recurrences': recurrences,
+    }
+    _writeCache(cache_path, cache)